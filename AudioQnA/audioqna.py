@@ -1,12 +1,21 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
+import base64
+import json
 import os
+import re
+import time
 
+import aiohttp
 from comps import MegaServiceEndpoint, MicroService, ServiceOrchestrator, ServiceRoleType, ServiceType
 from comps.cores.proto.api_protocol import AudioChatCompletionRequest, ChatCompletionResponse
 from comps.cores.proto.docarray import LLMParams
 from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from long_audio import transcribe_long_audio
+from summary_cache import SummaryCache
 
 MEGA_SERVICE_PORT = int(os.getenv("MEGA_SERVICE_PORT", 8888))
 
@@ -17,6 +26,19 @@ SPEECHT5_SERVER_PORT = int(os.getenv("SPEECHT5_SERVER_PORT", 7055))
 LLM_SERVER_HOST_IP = os.getenv("LLM_SERVER_HOST_IP", "0.0.0.0")
 LLM_SERVER_PORT = int(os.getenv("LLM_SERVER_PORT", 3006))
 
+# In stream mode, sentences of the LLM answer are synthesized as they arrive,
+# at most TTS_CONCURRENCY at a time
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", 2))
+# Sentences shorter than this are merged with the next one
+MIN_SENTENCE_CHARS = 20
+SENTENCE_END = re.compile(r"[.!?;:](?=\s)|[。！？；\n]")
+
+# Synthesized answers are cached on disk, gzip compressed, up to
+# VOICE_CACHE_SIZE_MB in total; 0 disables the cache. With the cache, the
+# megaservice graphs end at the LLM and answers are spoken by synthesize
+VOICE_CACHE_DIR = os.getenv("VOICE_CACHE_DIR", "/tmp/audioqna_cache")
+VOICE_CACHE_SIZE = int(float(os.getenv("VOICE_CACHE_SIZE_MB", 256)) * 1024 * 1024)
+
 
 def align_inputs(self, inputs, cur_node, runtime_graph, llm_parameters_dict, **kwargs):
     if self.services[cur_node].service_type == ServiceType.LLM:
@@ -40,12 +62,83 @@ def align_inputs(self, inputs, cur_node, runtime_graph, llm_parameters_dict, **k
     return inputs
 
 
+voice_cache = SummaryCache(VOICE_CACHE_DIR, VOICE_CACHE_SIZE, compress=True)
+
+
+def voice_cache_key(text: str, voice: str) -> str:
+    # Answers differing only by whitespace sound the same
+    return SummaryCache.make_key(text=" ".join(text.split()), voice=voice)
+
+
+async def synthesize(session, text: str, voice: str) -> str:
+    """Synthesize the answer, or a sentence of it in stream mode, from the
+    voice cache when the text was already spoken.
+
+    Args:
+        session (aiohttp.ClientSession): Session for the TTS request.
+        text (str): Text to speak.
+        voice (str): Voice of the TTS service.
+
+    Returns:
+        str: Base64 encoded audio.
+    """
+    key = voice_cache_key(text, voice)
+    if voice_cache.enabled:
+        entry = await asyncio.to_thread(voice_cache.get, key)
+        if entry is not None:
+            return entry["tts_result"]
+    tts_url = f"http://{SPEECHT5_SERVER_HOST_IP}:{SPEECHT5_SERVER_PORT}/v1/tts"
+    start = time.monotonic()
+    async with session.post(tts_url, json={"text": text, "voice": voice}) as response:
+        response.raise_for_status()
+        audio_base64 = (await response.json())["tts_result"]
+    if voice_cache.enabled:
+        entry = {"tts_result": audio_base64, "seconds": time.monotonic() - start}
+        await asyncio.to_thread(voice_cache.put, key, entry)
+    return audio_base64
+
+
+def accepts_audio(request: Request) -> bool:
+    return "audio/" in request.headers.get("accept", "")
+
+
+def split_sentences(buffer: str):
+    # Complete sentences at the start of buffer, and the remaining text
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(buffer):
+        if match.end() - start >= MIN_SENTENCE_CHARS:
+            sentences.append(buffer[start : match.end()].strip())
+            start = match.end()
+    return [sentence for sentence in sentences if sentence], buffer[start:]
+
+
+async def iter_llm_deltas(session, inputs: dict):
+    # Content deltas of a streamed /v1/chat/completions response
+    llm_url = f"http://{LLM_SERVER_HOST_IP}:{LLM_SERVER_PORT}/v1/chat/completions"
+    async with session.post(llm_url, json=inputs) as response:
+        response.raise_for_status()
+        async for line in response.content:
+            line = line.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            payload = line[len("data:") :].strip()
+            if payload == "[DONE]":
+                break
+            choices = json.loads(payload).get("choices") or [{}]
+            content = choices[0].get("delta", {}).get("content")
+            if content:
+                yield content
+
+
 class AudioQnAService:
     def __init__(self, host="0.0.0.0", port=8000):
         self.host = host
         self.port = port
         ServiceOrchestrator.align_inputs = align_inputs
         self.megaservice = ServiceOrchestrator()
+        # Same flow without ASR, for audio transcribed by segments
+        self.megaservice_text = ServiceOrchestrator()
 
         self.endpoint = str(MegaServiceEndpoint.AUDIO_QNA)
 
@@ -74,9 +167,14 @@ class AudioQnAService:
             use_remote_service=True,
             service_type=ServiceType.TTS,
         )
-        self.megaservice.add(asr).add(llm).add(tts)
+        self.megaservice.add(asr).add(llm)
         self.megaservice.flow_to(asr, llm)
-        self.megaservice.flow_to(llm, tts)
+        self.megaservice_text.add(llm)
+        if not voice_cache.enabled:
+            self.megaservice.add(tts)
+            self.megaservice.flow_to(llm, tts)
+            self.megaservice_text.add(tts)
+            self.megaservice_text.flow_to(llm, tts)
 
     async def handle_request(self, request: Request):
         data = await request.json()
@@ -91,19 +189,123 @@ class AudioQnAService:
             frequency_penalty=chat_request.frequency_penalty if chat_request.frequency_penalty else 0.0,
             presence_penalty=chat_request.presence_penalty if chat_request.presence_penalty else 0.0,
             repetition_penalty=chat_request.repetition_penalty if chat_request.repetition_penalty else 1.03,
-            stream=False,  # TODO add stream LLM output as input to TTS
+            stream=False,
+        )
+        voice = chat_request.voice if hasattr(chat_request, "voice") else "default"
+        transcript = await transcribe_long_audio(
+            chat_request.audio, f"http://{WHISPER_SERVER_HOST_IP}:{WHISPER_SERVER_PORT}/v1/asr"
         )
-        result_dict, runtime_graph = await self.megaservice.schedule(
-            initial_inputs={"audio": chat_request.audio},
+        if getattr(chat_request, "stream", False):
+            return StreamingResponse(
+                self.stream_answer(chat_request, parameters, voice, transcript), media_type="text/event-stream"
+            )
+        if transcript is not None:
+            megaservice = self.megaservice_text
+            initial_inputs = {"asr_result": transcript}
+        else:
+            megaservice = self.megaservice
+            initial_inputs = {"audio": chat_request.audio}
+        result_dict, runtime_graph = await megaservice.schedule(
+            initial_inputs=initial_inputs,
             llm_parameters=parameters,
-            voice=chat_request.voice if hasattr(chat_request, "voice") else "default",
+            voice=voice,
         )
 
         last_node = runtime_graph.all_leaves()[-1]
-        response = result_dict[last_node]["tts_result"]
+        if voice_cache.enabled:
+            # The graph ends at the LLM, speak the answer through the voice cache
+            answer = result_dict[last_node]["choices"][0]["message"]["content"]
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None)) as session:
+                response = await synthesize(session, answer, voice)
+        else:
+            response = result_dict[last_node]["tts_result"]
 
+        if accepts_audio(request):
+            # Raw audio for clients that ask for it, instead of a base64 JSON string
+            return Response(content=base64.b64decode(response), media_type="audio/wav")
         return response
 
+    async def stream_answer(self, chat_request, parameters: LLMParams, voice: str, transcript: str = None):
+        """Stream the spoken answer sentence by sentence, as server-sent events.
+
+        The LLM answer is streamed and split into sentences, which are sent to
+        the TTS service concurrently. Audio is returned in sentence order.
+
+        Args:
+            chat_request (AudioChatCompletionRequest): The request.
+            parameters (LLMParams): LLM parameters.
+            voice (str): Voice of the TTS service.
+            transcript (str): Transcript of the audio, if already transcribed.
+
+        Returns:
+            AsyncIterator[str]: Events with the text and base64 encoded audio of each sentence.
+        """
+        asr_url = f"http://{WHISPER_SERVER_HOST_IP}:{WHISPER_SERVER_PORT}/v1/asr"
+        semaphore = asyncio.Semaphore(TTS_CONCURRENCY)
+        # Synthesis tasks in sentence order, None once the answer is complete
+        queue = asyncio.Queue()
+
+        async def speak(session, sentence):
+            async with semaphore:
+                return sentence, await synthesize(session, sentence, voice)
+
+        async def produce(session):
+            try:
+                question = transcript
+                if question is None:
+                    async with session.post(asr_url, json={"audio": chat_request.audio}) as response:
+                        response.raise_for_status()
+                        question = (await response.json())["asr_result"]
+                inputs = align_inputs(
+                    self.megaservice,
+                    {
+                        "asr_result": question,
+                        "stream": True,
+                        "frequency_penalty": parameters.frequency_penalty,
+                        "temperature": parameters.temperature,
+                    },
+                    "llm",
+                    None,
+                    {"max_tokens": parameters.max_tokens, "top_p": parameters.top_p},
+                )
+                buffer = ""
+                async for delta in iter_llm_deltas(session, inputs):
+                    sentences, buffer = split_sentences(buffer + delta)
+                    for sentence in sentences:
+                        queue.put_nowait(asyncio.create_task(speak(session, sentence)))
+                if buffer.strip():
+                    queue.put_nowait(asyncio.create_task(speak(session, buffer.strip())))
+            finally:
+                queue.put_nowait(None)
+
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None)) as session:
+            producer = asyncio.create_task(produce(session))
+            pending = []
+            try:
+                while (task := await queue.get()) is not None:
+                    pending.append(task)
+                    sentence, audio = await task
+                    pending.remove(task)
+                    yield f"data: {json.dumps({'text': sentence, 'tts_result': audio})}\n\n"
+                # Surface errors of the LLM or ASR requests
+                await producer
+                yield "data: [DONE]\n\n"
+            finally:
+                producer.cancel()
+                while not queue.empty():
+                    task = queue.get_nowait()
+                    if task is not None:
+                        pending.append(task)
+                for task in pending:
+                    task.cancel()
+
+    async def get_cache_stats(self):
+        return voice_cache.stats()
+
+    async def purge_cache(self):
+        removed = await asyncio.to_thread(voice_cache.purge)
+        return {"purged": removed}
+
     def start(self):
         self.service = MicroService(
             self.__class__.__name__,
@@ -115,6 +317,8 @@ class AudioQnAService:
             output_datatype=ChatCompletionResponse,
         )
         self.service.add_route(self.endpoint, self.handle_request, methods=["POST"])
+        self.service.add_route(self.endpoint + "/cache", self.get_cache_stats, methods=["GET"])
+        self.service.add_route(self.endpoint + "/cache", self.purge_cache, methods=["DELETE"])
         self.service.start()
 
 
@@ -8,6 +8,7 @@ from comps import MegaServiceEndpoint, MicroService, ServiceOrchestrator, Servic
 from comps.cores.proto.api_protocol import AudioChatCompletionRequest, ChatCompletionResponse
 from comps.cores.proto.docarray import LLMParams
 from fastapi import Request
+from fastapi.responses import Response
 
 MEGA_SERVICE_PORT = int(os.getenv("MEGA_SERVICE_PORT", 8888))
 
@@ -44,6 +45,9 @@ def align_inputs(self, inputs, cur_node, runtime_graph, llm_parameters_dict, **k
 
 def align_outputs(self, data, cur_node, inputs, runtime_graph, llm_parameters_dict, **kwargs):
     if self.services[cur_node].service_type == ServiceType.TTS:
+        if kwargs.get("binary_audio"):
+            # Keep the raw bytes, the client asked for audio rather than base64
+            return {"byte_str": data}
         audio_base64 = base64.b64encode(data).decode("utf-8")
         return {"byte_str": audio_base64}
     return data
@@ -105,13 +109,16 @@ class AudioQnAService:
             repetition_penalty=chat_request.repetition_penalty if chat_request.repetition_penalty else 1.03,
             stream=False,  # TODO add stream LLM output as input to TTS
         )
+        binary_audio = "audio/" in request.headers.get("accept", "")
         result_dict, runtime_graph = await self.megaservice.schedule(
-            initial_inputs={"audio": chat_request.audio}, llm_parameters=parameters
+            initial_inputs={"audio": chat_request.audio}, llm_parameters=parameters, binary_audio=binary_audio
         )
 
         last_node = runtime_graph.all_leaves()[-1]
         response = result_dict[last_node]["byte_str"]
 
+        if binary_audio:
+            return Response(content=response, media_type="audio/wav")
         return response
 
     def start(self):
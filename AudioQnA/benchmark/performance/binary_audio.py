@@ -0,0 +1,68 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+"""Payload size and latency of spoken answers returned as base64 JSON or raw WAV.
+
+The same question is sent to a running AudioQnA megaservice with and without
+"Accept: audio/wav", alternately, and the answers are timed until the client
+holds the decoded audio. Answers of the LLM vary, compare the medians over
+enough runs, e.g. with a low temperature:
+
+    python benchmark/performance/binary_audio.py --url http://${host_ip}:3008/v1/audioqna --audio question.wav
+"""
+
+import argparse
+import base64
+import json
+import statistics
+import time
+import urllib.request
+
+# Short silent WAV, as in the compose tests
+DEFAULT_AUDIO = "UklGRigAAABXQVZFZm10IBIAAAABAAEARKwAAIhYAQACABAAAABkYXRhAgAAAAEA"
+
+
+def ask(url: str, body: bytes, binary: bool):
+    # Size of the response body, and seconds until the audio is decoded
+    headers = {"Content-Type": "application/json"}
+    if binary:
+        headers["Accept"] = "audio/wav"
+    request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        payload = response.read()
+        content_type = response.headers.get("Content-Type", "")
+    if binary:
+        assert content_type.startswith("audio/wav"), f"expected audio/wav, got {content_type}"
+        audio = payload
+    else:
+        audio = base64.b64decode(json.loads(payload))
+    elapsed = time.perf_counter() - start
+    assert audio.startswith(b"RIFF"), "the answer is not a WAV file"
+    return len(payload), len(audio), elapsed
+
+
+def main(args):
+    audio = DEFAULT_AUDIO
+    if args.audio:
+        with open(args.audio, "rb") as f:
+            audio = base64.b64encode(f.read()).decode("utf-8")
+    body = json.dumps({"audio": audio, "max_tokens": args.max_tokens, "temperature": 0.01}).encode()
+    results = {False: [], True: []}
+    for _ in range(args.runs):
+        for binary in results:
+            results[binary].append(ask(args.url, body, binary))
+    print(f"median of {args.runs} runs")
+    print(f"{'response':>10} {'payload KiB':>12} {'audio KiB':>10} {'seconds':>8}")
+    for binary, runs in results.items():
+        payload, audio, elapsed = (statistics.median(values) for values in zip(*runs))
+        print(f"{'raw WAV' if binary else 'base64':>10} {payload / 1024:>12.1f} {audio / 1024:>10.1f} {elapsed:>8.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://localhost:3008/v1/audioqna", help="AudioQnA megaservice endpoint")
+    parser.add_argument("--audio", help="WAV file of the question, a short silence by default")
+    parser.add_argument("--max-tokens", type=int, default=128, help="Length of the answers")
+    parser.add_argument("--runs", type=int, default=10)
+    main(parser.parse_args())
@@ -0,0 +1,101 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+"""Scaling of the transcription of long audio by segments against a stub ASR service.
+
+The audio is synthetic: each sample holds the second it belongs to, with half a
+second of silence every few seconds for the splitter to cut at. The stub
+answers /v1/asr after a fixed latency with the first non-silent sample of the
+segment, so that the transcript tells whether segments were stitched in order.
+Run it from a checkout with aiohttp and numpy installed:
+
+    python benchmark/performance/long_audio_stub.py
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import time
+
+import numpy as np
+from aiohttp import web
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "..", "..", "common"))
+
+import long_audio  # noqa: E402
+
+SAMPLE_RATE = 16000
+
+
+def make_audio(seconds: int, silence_every: int) -> str:
+    t = np.arange(seconds * SAMPLE_RATE) // SAMPLE_RATE
+    samples = (t + 1).astype(np.int16)
+    samples[(t % silence_every == silence_every - 1) & (np.arange(len(t)) % SAMPLE_RATE < SAMPLE_RATE // 2)] = 0
+    return long_audio.encode_wav(samples, SAMPLE_RATE)
+
+
+class StubASR:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self.running = 0
+        self.peak = 0
+
+    async def handle(self, request):
+        body = await request.json()
+        samples, _ = long_audio.read_wav(base64.b64decode(body["audio"]))
+        self.calls += 1
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.running -= 1
+        return web.json_response({"asr_result": str(samples[np.flatnonzero(samples)[0]])})
+
+    def reset(self):
+        self.calls = 0
+        self.peak = 0
+
+
+async def main(args):
+    asr = StubASR(args.latency)
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/v1/asr", asr.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    asr_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/v1/asr"
+
+    audio = make_audio(args.seconds, args.silence_every)
+    print(f"{args.seconds}s of audio, {len(audio) / 1024 / 1024:.1f} MiB of base64")
+    print(f"{'concurrency':>11} {'calls':>6} {'peak':>5} {'seconds':>8} {'speedup':>8}")
+    baseline = None
+    try:
+        assert await long_audio.transcribe_long_audio(make_audio(2, 2), asr_url) is None, "short audio was split"
+        for concurrency in args.concurrency:
+            long_audio.ASR_CONCURRENCY = concurrency
+            asr.reset()
+            start = time.perf_counter()
+            transcript = await long_audio.transcribe_long_audio(audio, asr_url)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{concurrency:>11} {asr.calls:>6} {asr.peak:>5} {elapsed:>8.2f} {baseline / elapsed:>7.1f}x")
+            assert asr.peak <= concurrency, f"{asr.peak} requests in flight, limit is {concurrency}"
+            starts = [int(text) for text in transcript.split()]
+            assert starts == sorted(starts) and starts[0] == 1, f"segments out of order: {starts}"
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=int, default=300, help="Duration of the audio")
+    parser.add_argument("--silence-every", type=int, default=7, help="Seconds between silences")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds taken by the stub ASR per request")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,132 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+"""Time to first audio of the streamed answer against stub LLM and TTS services.
+
+The stub LLM streams its answer word by word with a fixed delay per word, the
+stub TTS answers after a delay that grows with the length of the text, so
+that the time measured is the one of the megaservice pipelining. The streamed
+answer is compared with the answer spoken at once, as without "stream", whose
+audio comes after the whole generation and synthesis. Run it where the AudioQnA
+megaservice runs, or from a checkout with the GenAIComps dependencies installed:
+
+    python benchmark/performance/stream_answer_stub.py
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+import aiohttp
+from aiohttp import web
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "..", ".."), os.path.join(HERE, "..", "..", "..", "common")]
+# Every run must reach the stub TTS
+os.environ["VOICE_CACHE_SIZE_MB"] = "0"
+
+import audioqna  # noqa: E402
+from comps.cores.proto.docarray import LLMParams  # noqa: E402
+
+ANSWER = (
+    "The megaservice streams the answer of the model. Each sentence is sent to the speech service "
+    "as soon as it is complete. Audio of the first sentence is played while the next ones are generated. "
+    "Sentences are synthesized concurrently and returned in order. Short sentences are merged with the next one."
+)
+
+
+class Stubs:
+    def __init__(self, word_latency: float, tts_latency: float, tts_char_latency: float):
+        self.word_latency = word_latency
+        self.tts_latency = tts_latency
+        self.tts_char_latency = tts_char_latency
+        self.tts_calls = 0
+
+    async def chat_completions(self, request):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in ANSWER.split(" "):
+            await asyncio.sleep(self.word_latency)
+            chunk = {"choices": [{"delta": {"content": word + " "}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def tts(self, request):
+        body = await request.json()
+        self.tts_calls += 1
+        await asyncio.sleep(self.tts_latency + self.tts_char_latency * len(body["text"]))
+        return web.json_response({"tts_result": base64.b64encode(body["text"].encode()).decode()})
+
+
+async def spoken_at_once(voice: str):
+    # The non-streamed flow: whole answer, then one synthesis
+    inputs = {"model": "tgi", "messages": [{"role": "user", "content": "question"}], "stream": True}
+    async with aiohttp.ClientSession() as session:
+        answer = "".join([delta async for delta in audioqna.iter_llm_deltas(session, inputs)])
+        await audioqna.synthesize(session, answer.strip(), voice)
+
+
+async def streamed(service, voice: str, parameters: LLMParams):
+    # Seconds to the first audio event and to the end of the stream
+    start = time.perf_counter()
+    first = None
+    async for event in service.stream_answer(SimpleNamespace(audio=None), parameters, voice, transcript="question"):
+        if first is None and "tts_result" in event:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+async def main(args):
+    stubs = Stubs(args.word_latency, args.tts_latency, args.tts_char_latency)
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", stubs.chat_completions)
+    app.router.add_post("/v1/tts", stubs.tts)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    audioqna.LLM_SERVER_HOST_IP = audioqna.SPEECHT5_SERVER_HOST_IP = "127.0.0.1"
+    audioqna.LLM_SERVER_PORT = audioqna.SPEECHT5_SERVER_PORT = port
+    audioqna.TTS_CONCURRENCY = args.tts_concurrency
+
+    service = audioqna.AudioQnAService()
+    service.add_remote_service()
+    parameters = LLMParams(max_tokens=128, top_p=0.95, temperature=0.01, frequency_penalty=0.0, stream=True)
+    try:
+        at_once = []
+        first_audio = []
+        total = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            await spoken_at_once("default")
+            at_once.append(time.perf_counter() - start)
+            stubs.tts_calls = 0
+            first, end = await streamed(service, "default", parameters)
+            first_audio.append(first)
+            total.append(end)
+        print(f"{stubs.tts_calls} sentences, TTS_CONCURRENCY={args.tts_concurrency}, median of {args.runs} runs")
+        print(f"first audio, spoken at once: {statistics.median(at_once):.2f}s")
+        print(f"first audio, streamed:       {statistics.median(first_audio):.2f}s")
+        print(f"last audio, streamed:        {statistics.median(total):.2f}s")
+        assert statistics.median(first_audio) < statistics.median(at_once), "streaming did not speak first"
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--word-latency", type=float, default=0.02, help="Seconds taken by the stub LLM per word")
+    parser.add_argument("--tts-latency", type=float, default=0.1, help="Seconds taken by the stub TTS per request")
+    parser.add_argument("--tts-char-latency", type=float, default=0.002, help="Seconds taken by the stub TTS per char")
+    parser.add_argument("--tts-concurrency", type=int, default=audioqna.TTS_CONCURRENCY)
+    parser.add_argument("--runs", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
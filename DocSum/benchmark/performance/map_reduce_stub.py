@@ -0,0 +1,93 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+"""Scaling of the megaservice-level map_reduce against a stub LLM microservice.
+
+The stub answers /v1/docsum after a fixed latency with the first characters of
+the query, so that the time measured is the one of the fan-out and not of the
+model. Run it where the DocSum megaservice runs, or from a checkout with the
+GenAIComps dependencies installed:
+
+    python benchmark/performance/map_reduce_stub.py
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from aiohttp import web
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "..", ".."), os.path.join(HERE, "..", "..", "..", "common")]
+
+import docsum  # noqa: E402
+from comps.cores.proto.docarray import DocSumLLMParams  # noqa: E402
+
+
+class StubLLM:
+    def __init__(self, latency: float, summary_chars: int):
+        self.latency = latency
+        self.summary_chars = summary_chars
+        self.calls = 0
+        self.running = 0
+        self.peak = 0
+
+    async def handle(self, request):
+        body = await request.json()
+        self.calls += 1
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.running -= 1
+        return web.json_response({"text": body["query"][: self.summary_chars]})
+
+    def reset(self):
+        self.calls = 0
+        self.peak = 0
+
+
+async def main(args):
+    llm = StubLLM(args.latency, args.summary_chars)
+    app = web.Application()
+    app.router.add_post("/v1/docsum", llm.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    docsum.LLM_SERVICE_HOST_IP = "127.0.0.1"
+    docsum.LLM_SERVICE_PORT = site._server.sockets[0].getsockname()[1]
+
+    chunk_chars = docsum.MAP_REDUCE_CHUNK_TOKENS * docsum.CHARS_PER_TOKEN
+    line = "lorem ipsum dolor sit amet " * 3
+    text = "\n".join([line] * (args.chunks * chunk_chars // (len(line) + 1)))
+    service = docsum.DocSumService()
+    parameters = DocSumLLMParams(query="", summary_type="map_reduce")
+
+    print(f"{'concurrency':>11} {'calls':>6} {'peak':>5} {'seconds':>8} {'speedup':>8}")
+    baseline = None
+    try:
+        for concurrency in args.concurrency:
+            docsum.MAP_REDUCE_CONCURRENCY = concurrency
+            llm.reset()
+            start = time.perf_counter()
+            summary = await service.map_reduce(text, parameters)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{concurrency:>11} {llm.calls:>6} {llm.peak:>5} {elapsed:>8.2f} {baseline / elapsed:>7.1f}x")
+            assert llm.peak <= concurrency, f"{llm.peak} requests in flight, limit is {concurrency}"
+            assert len(summary) <= chunk_chars, "summaries were not reduced to a single chunk"
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chunks", type=int, default=32, help="Size of the document, in map_reduce chunks")
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds taken by the stub LLM per request")
+    parser.add_argument("--summary-chars", type=int, default=200, help="Length of the stub summaries")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    asyncio.run(main(parser.parse_args()))
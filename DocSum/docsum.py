@@ -5,9 +5,10 @@ import asyncio
 import base64
 import os
 import subprocess
-import uuid
+import tempfile
 from typing import List
 
+import aiohttp
 from comps import MegaServiceEndpoint, MicroService, ServiceOrchestrator, ServiceRoleType, ServiceType
 from comps.cores.mega.utils import handle_message
 from comps.cores.proto.api_protocol import (
@@ -20,6 +21,9 @@ from comps.cores.proto.api_protocol import (
 from comps.cores.proto.docarray import DocSumLLMParams
 from fastapi import File, Request, UploadFile
 from fastapi.responses import StreamingResponse
+from long_audio import ffmpeg_semaphore, transcribe_long_audio
+from summary_cache import SummaryCache, cached_response
+from uploads import extract_upload, spool_upload
 
 MEGA_SERVICE_PORT = int(os.getenv("MEGA_SERVICE_PORT", 8888))
 
@@ -29,6 +33,26 @@ ASR_SERVICE_PORT = int(os.getenv("ASR_SERVICE_PORT", 7066))
 LLM_SERVICE_HOST_IP = os.getenv("LLM_SERVICE_HOST_IP", "0.0.0.0")
 LLM_SERVICE_PORT = int(os.getenv("LLM_SERVICE_PORT", 9000))
 
+# Megaservice-level map-reduce for the map_reduce summary type: text is split
+# into chunks of about MAP_REDUCE_CHUNK_TOKENS tokens, summarized concurrently
+# by the LLM microservice and the summaries are reduced until they fit one chunk
+MAP_REDUCE_IN_MEGASERVICE = os.getenv("MAP_REDUCE_IN_MEGASERVICE", "true").lower() == "true"
+MAP_REDUCE_CHUNK_TOKENS = int(os.getenv("MAP_REDUCE_CHUNK_TOKENS", 512))
+MAP_REDUCE_CONCURRENCY = int(os.getenv("MAP_REDUCE_CONCURRENCY", 4))
+# Tokens are estimated from characters, the megaservice has no tokenizer
+CHARS_PER_TOKEN = 4
+
+# Audio is extracted from videos by ffmpeg through pipes, with at most
+# FFMPEG_CONCURRENCY processes at a time, see long_audio
+VIDEO_AUDIO_16K = os.getenv("VIDEO_AUDIO_16K", "true").lower() == "true"
+# Base64 characters decoded at a time, a multiple of 4
+VIDEO_DECODE_CHUNK = 4 * 1024 * 1024
+
+# Outputs of identical requests are cached on disk, up to SUMMARY_CACHE_SIZE_MB,
+# 0 disables the cache
+SUMMARY_CACHE_DIR = os.getenv("SUMMARY_CACHE_DIR", "/tmp/docsum_cache")
+SUMMARY_CACHE_SIZE = int(float(os.getenv("SUMMARY_CACHE_SIZE_MB", 256)) * 1024 * 1024)
+
 
 def align_inputs(self, inputs, cur_node, runtime_graph, llm_parameters_dict, **kwargs):
     if self.services[cur_node].service_type == ServiceType.LLM:
@@ -42,22 +66,51 @@ def align_inputs(self, inputs, cur_node, runtime_graph, llm_parameters_dict, **k
             docsum_parameters = docsum_parameters.model_dump()
             del docsum_parameters["query"]
             inputs.update(docsum_parameters)
-    elif self.services[cur_node].service_type == ServiceType.ASR:
-        if "video" in inputs:
-            audio_base64 = video2audio(inputs["video"])
-            inputs["audio"] = audio_base64
     return inputs
 
 
-def read_pdf(file):
-    from langchain.document_loaders import PyPDFLoader
+async def run_ffmpeg(args: List[str], video_base64: str = None) -> bytes:
+    # Run ffmpeg with the decoded video fed to its stdin, if given, and return
+    # what it writes to stdout
+    async with ffmpeg_semaphore:
+        proc = await asyncio.create_subprocess_exec(
+            "ffmpeg",
+            *args,
+            stdin=asyncio.subprocess.PIPE if video_base64 is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+
+        async def feed():
+            try:
+                # Decode by slices, the whole video is never held in memory twice
+                for i in range(0, len(video_base64), VIDEO_DECODE_CHUNK):
+                    proc.stdin.write(base64.b64decode(video_base64[i : i + VIDEO_DECODE_CHUNK]))
+                    await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # ffmpeg stopped reading, its return code tells why
+                pass
+            finally:
+                proc.stdin.close()
+
+        if video_base64 is not None:
+            audio, _ = await asyncio.gather(proc.stdout.read(), feed())
+        else:
+            audio = await proc.stdout.read()
+        await proc.wait()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, ["ffmpeg", *args])
+    return audio
+
 
-    loader = PyPDFLoader(file)
-    docs = loader.load_and_split()
-    return docs
+def write_base64(file, data_base64: str):
+    # Decode by slices, as when feeding ffmpeg
+    for i in range(0, len(data_base64), VIDEO_DECODE_CHUNK):
+        file.write(base64.b64decode(data_base64[i : i + VIDEO_DECODE_CHUNK]))
+    file.flush()
 
 
-def video2audio(
+async def video2audio(
     video_base64: str,
 ) -> str:
     """Convert a base64 video string to a base64 audio string using ffmpeg.
@@ -68,58 +121,80 @@ def video2audio(
     Returns:
         str: Base64 encoded audio string.
     """
-    video_data = base64.b64decode(video_base64)
+    if any(c.isspace() for c in video_base64[:VIDEO_DECODE_CHUNK]):
+        video_base64 = "".join(video_base64.split())
+    output_args = ["-vn", "-map", "a", "-q:a", "0"]
+    if VIDEO_AUDIO_16K:
+        # What Whisper works with, shrinks the payload sent to the ASR service
+        output_args += ["-ar", "16000", "-ac", "1"]
+    output_args += ["-f", "mp3", "pipe:1"]
+    try:
+        audio = await run_ffmpeg(["-i", "pipe:0", *output_args], video_base64)
+    except subprocess.CalledProcessError:
+        # Videos whose index is at the end of the file (e.g. some MP4) cannot
+        # be read from a pipe, fall back to a temporary file
+        with tempfile.NamedTemporaryFile(suffix=".mp4") as video_file:
+            # Decoded and written out of the event loop, videos may be large
+            await asyncio.to_thread(write_base64, video_file, video_base64)
+            audio = await run_ffmpeg(["-i", video_file.name, *output_args])
+    return base64.b64encode(audio).decode("utf-8")
 
-    uid = str(uuid.uuid4())
-    temp_video_path = f"{uid}.mp4"
-    temp_audio_path = f"{uid}.mp3"
-    with open(temp_video_path, "wb") as video_file:
-        video_file.write(video_data)
 
-    try:
-        subprocess.run(
-            ["ffmpeg", "-i", temp_video_path, "-q:a", "0", "-map", "a", temp_audio_path],
-            check=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.STDOUT,
-        )
-        # Read the extracted audio file and encode it to base64
-        with open(temp_audio_path, "rb") as audio_file:
-            audio_base64 = base64.b64encode(audio_file.read()).decode("utf-8")
-
-    finally:
-        # Clean up the temporary video file
-        os.remove(temp_video_path)
-        os.remove(temp_audio_path)
-
-    return audio_base64
-
-
-def read_text_from_file(file, save_file_name):
-    import docx2txt
-    from langchain.text_splitter import CharacterTextSplitter
-
-    # read text file
-    if file.headers["content-type"] == "text/plain":
-        file.file.seek(0)
-        content = file.file.read().decode("utf-8")
-        # Split text
-        text_splitter = CharacterTextSplitter()
-        texts = text_splitter.split_text(content)
-        # Create multiple documents
-        file_content = texts
-    # read pdf file
-    elif file.headers["content-type"] == "application/pdf":
-        documents = read_pdf(save_file_name)
-        file_content = [doc.page_content for doc in documents]
-    # read docx file
-    elif (
-        file.headers["content-type"] == "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        or file.headers["content-type"] == "application/octet-stream"
-    ):
-        file_content = docx2txt.process(save_file_name)
-
-    return file_content
+async def read_upload(file: UploadFile):
+    # Spool the upload, up to MAX_UPLOAD_SIZE_MB, then extract the text out
+    # of the event loop so that other requests are not stalled
+    with tempfile.NamedTemporaryFile() as upload:
+        await spool_upload(file, upload)
+        return await extract_upload(file, upload.name)
+
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """Split text into chunks of at most max_chars characters, on line
+    boundaries when possible.
+
+    Args:
+        text (str): Text to split.
+        max_chars (int): Maximum number of characters of a chunk.
+
+    Returns:
+        List[str]: Chunks of the text.
+    """
+    chunks = []
+    current = []
+    current_len = 0
+    for line in text.split("\n"):
+        while len(line) > max_chars:
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and current_len + len(line) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current = []
+            current_len = 0
+        current.append(line)
+        current_len += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def group_texts(texts: List[str], max_chars: int) -> List[str]:
+    # Pack consecutive texts into groups of at most max_chars characters
+    groups = []
+    current = []
+    current_len = 0
+    for text in texts:
+        if current and current_len + len(text) + 1 > max_chars:
+            groups.append("\n".join(current))
+            current = []
+            current_len = 0
+        current.append(text)
+        current_len += len(text) + 1
+    if current:
+        groups.append("\n".join(current))
+    return groups
+
+
+summary_cache = SummaryCache(SUMMARY_CACHE_DIR, SUMMARY_CACHE_SIZE)
 
 
 class DocSumService:
@@ -182,11 +257,6 @@ class DocSumService:
             file_summaries = []
             if files:
                 for file in files:
-                    # Fix concurrency issue with the same file name
-                    # https://github.com/opea-project/GenAIExamples/issues/1279
-                    uid = str(uuid.uuid4())
-                    file_path = f"/tmp/{uid}"
-
                     if data_type is not None and data_type in ["audio", "video"]:
                         raise ValueError(
                             "Audio and Video file uploads are not supported in docsum with curl request, \
@@ -194,18 +264,7 @@ class DocSumService:
                         )
 
                     else:
-                        import aiofiles
-
-                        async with aiofiles.open(file_path, "wb") as f:
-                            await f.write(await file.read())
-
-                        docs = read_text_from_file(file, file_path)
-                        os.remove(file_path)
-
-                        if isinstance(docs, list):
-                            file_summaries.extend(docs)
-                        else:
-                            file_summaries.append(docs)
+                        file_summaries.extend(await read_upload(file))
 
             if file_summaries:
                 prompt = handle_message(chat_request.messages) + "\n".join(file_summaries)
@@ -238,7 +297,39 @@ class DocSumService:
             chunk_overlap=chunk_overlap,
             chunk_size=chunk_size,
         )
+        cache_key = None
+        if summary_cache.enabled:
+            # Hashed out of the event loop, inputs may hold large base64 payloads
+            cache_key = await asyncio.to_thread(
+                SummaryCache.make_key,
+                inputs=initial_inputs_data,
+                summary_type=summary_type,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                model=docsum_parameters.model,
+                max_tokens=docsum_parameters.max_tokens,
+                language=docsum_parameters.language,
+                stream=docsum_parameters.stream,
+            )
+            entry = await asyncio.to_thread(summary_cache.get, cache_key)
+            if entry is not None:
+                return cached_response(entry, "docsum")
+
+        if "video" in initial_inputs_data:
+            # Converted here, align_inputs runs synchronously in the event loop
+            initial_inputs_data = {"audio": await video2audio(initial_inputs_data["video"])}
+        if "audio" in initial_inputs_data:
+            transcript = await transcribe_long_audio(
+                initial_inputs_data["audio"], f"http://{ASR_SERVICE_HOST_IP}:{ASR_SERVICE_PORT}/v1/asr"
+            )
+            if transcript is not None:
+                # Summarized like text, map-reduce included
+                initial_inputs_data = {"text": transcript}
         text_only = "text" in initial_inputs_data
+        if text_only and summary_type == "map_reduce" and MAP_REDUCE_IN_MEGASERVICE:
+            # Only the final reduce goes through the orchestrator and is streamed
+            initial_inputs_data["text"] = await self.map_reduce(initial_inputs_data["text"], docsum_parameters)
+            docsum_parameters.summary_type = "auto"
         if not text_only:
             result_dict, runtime_graph = await self.megaservice.schedule(
                 initial_inputs=initial_inputs_data, docsum_parameters=docsum_parameters
@@ -251,7 +342,7 @@ class DocSumService:
                     and node == list(self.megaservice.services.keys())[-1]
                     and self.megaservice.services[node].service_type == ServiceType.LLM
                 ):
-                    return response
+                    return summary_cache.cache_stream(response, cache_key) if cache_key else response
         else:
             result_dict, runtime_graph = await self.megaservice_text_only.schedule(
                 initial_inputs=initial_inputs_data, docsum_parameters=docsum_parameters
@@ -264,10 +355,12 @@ class DocSumService:
                     and node == list(self.megaservice.services.keys())[-1]
                     and self.megaservice.services[node].service_type == ServiceType.LLM
                 ):
-                    return response
+                    return summary_cache.cache_stream(response, cache_key) if cache_key else response
 
         last_node = runtime_graph.all_leaves()[-1]
         response = result_dict[last_node]["text"]
+        if cache_key:
+            await asyncio.to_thread(summary_cache.put, cache_key, {"text": response})
         choices = []
         usage = UsageInfo()
         choices.append(
@@ -279,6 +372,53 @@ class DocSumService:
         )
         return ChatCompletionResponse(model="docsum", choices=choices, usage=usage)
 
+    async def summarize(self, session, text: str, parameters: dict, semaphore: asyncio.Semaphore) -> str:
+        payload = dict(parameters, query=text)
+        async with semaphore:
+            async with session.post(
+                f"http://{LLM_SERVICE_HOST_IP}:{LLM_SERVICE_PORT}/v1/docsum", json=payload
+            ) as response:
+                response.raise_for_status()
+                return (await response.json())["text"]
+
+    async def map_reduce(self, text: str, docsum_parameters: DocSumLLMParams) -> str:
+        """Summarize chunks of the text concurrently, then reduce the summaries
+        hierarchically until they fit in a single chunk.
+
+        Args:
+            text (str): Text to summarize.
+            docsum_parameters (DocSumLLMParams): Parameters of the request.
+
+        Returns:
+            str: Text for the final summary.
+        """
+        max_chars = MAP_REDUCE_CHUNK_TOKENS * CHARS_PER_TOKEN
+        texts = split_text(text, max_chars)
+        if len(texts) <= 1:
+            return text
+        parameters = docsum_parameters.model_dump()
+        parameters.update(stream=False, summary_type="auto")
+        semaphore = asyncio.Semaphore(MAP_REDUCE_CONCURRENCY)
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None)) as session:
+            while len(texts) > 1:
+                summaries = await asyncio.gather(
+                    *[self.summarize(session, chunk, parameters, semaphore) for chunk in texts]
+                )
+                groups = group_texts(summaries, max_chars)
+                if len(groups) >= len(texts):
+                    # Summaries do not get shorter, stop reducing
+                    texts = groups
+                    break
+                texts = groups
+        return "\n".join(texts)
+
+    async def get_cache_stats(self):
+        return summary_cache.stats()
+
+    async def purge_cache(self):
+        removed = await asyncio.to_thread(summary_cache.purge)
+        return {"purged": removed}
+
     def start(self):
 
         self.service = MicroService(
@@ -291,6 +431,8 @@ class DocSumService:
             output_datatype=ChatCompletionResponse,
         )
         self.service.add_route(self.endpoint, self.handle_request, methods=["POST"])
+        self.service.add_route(self.endpoint + "/cache", self.get_cache_stats, methods=["GET"])
+        self.service.add_route(self.endpoint + "/cache", self.purge_cache, methods=["DELETE"])
         self.service.start()
 
 
@@ -11,8 +11,9 @@ from urllib.parse import urlparse
 import gradio as gr
 import requests
 import uvicorn
+from doc_extraction import DOCX_CONTENT_TYPE, PDF_CONTENT_TYPE, UnsupportedFileType, content_type_from_name, iter_text
 from fastapi import FastAPI
-from langchain_community.document_loaders import Docx2txtLoader, PyPDFLoader, UnstructuredURLLoader
+from langchain_community.document_loaders import UnstructuredURLLoader
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -22,7 +23,7 @@ logger = logging.getLogger(__name__)
 class DocSumUI:
     def __init__(self):
         """Initialize the DocSumUI class with accepted file types, headers, and backend service endpoint."""
-        self.ACCEPTED_FILE_TYPES = ["pdf", "doc", "docx"]
+        self.ACCEPTED_FILE_TYPES = ["pdf", "docx"]
         self.HEADERS = {"Content-Type": "application/json"}
         self.BACKEND_SERVICE_ENDPOINT = os.getenv("BACKEND_SERVICE_ENDPOINT", "http://localhost:8888/v1/docsum")
 
@@ -49,20 +50,20 @@ class DocSumUI:
         Returns:
             str: The content of the file or an error message if the file type is unsupported.
         """
-        self.page_content = ""
-        self.pages = []
-
-        if file.name.endswith(".pdf"):
-            loader = PyPDFLoader(file)
-        elif file.name.endswith((".doc", ".docx")):
-            loader = Docx2txtLoader(file)
-        else:
+        content_type = content_type_from_name(file.name)
+        if content_type not in (PDF_CONTENT_TYPE, DOCX_CONTENT_TYPE):
             msg = f"Unsupported file type '{file.name}'. Choose from {self.ACCEPTED_FILE_TYPES}"
             logger.error(msg)
             return msg
 
-        for page in loader.lazy_load():
-            self.page_content += page.page_content
+        # Pages are parsed lazily and joined once
+        try:
+            self.pages = list(iter_text(file.name, content_type))
+        except UnsupportedFileType as e:
+            msg = f"Unsupported file '{file.name}': {e}"
+            logger.error(msg)
+            return msg
+        self.page_content = "".join(self.pages)
 
         return self.page_content
 
@@ -263,8 +264,8 @@ class DocSumUI:
 
         # File Upload UI
         file_ui = self.create_upload_ui(
-            label="Please upload a document (.pdf, .doc, .docx)",
-            file_types=[".pdf", ".doc", ".docx"],
+            label="Please upload a document (.pdf, .docx)",
+            file_types=[".pdf", ".docx"],
             process_function=self.read_file,
         )
 
@@ -1,2 +1,24 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
+
+from typing import Optional
+
+from edgecraftrag.components.pipeline import Pipeline
+from edgecraftrag.context import ctx
+from fastapi import HTTPException
+
+
+def pipeline_not_active(name: Optional[str]) -> HTTPException:
+    if name:
+        return HTTPException(status_code=404, detail=f"Pipeline {name} is not active")
+    return HTTPException(status_code=400, detail="No active pipeline")
+
+
+def get_active_pipeline(name: Optional[str]) -> Pipeline:
+    """Get an active pipeline by name or id, the default one if no name is given
+    :param name: pipeline requested by the client, may be None
+    :return: the active pipeline, raises 404 if it is unknown or inactive and 400 if there is none."""
+    pl = ctx.get_pipeline_mgr().get_active_pipeline(name)
+    if pl is None:
+        raise pipeline_not_active(name)
+    return pl
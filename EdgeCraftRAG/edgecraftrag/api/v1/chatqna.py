@@ -1,20 +1,31 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+from typing import Optional
+
 from comps import GeneratedDoc
-from comps.cores.proto.api_protocol import ChatCompletionRequest
-from edgecraftrag.api_schema import RagOut
+from edgecraftrag.api.v1 import get_active_pipeline, pipeline_not_active
+from edgecraftrag.api_schema import RagChatCompletionRequest, RagOut
 from edgecraftrag.context import ctx
-from fastapi import FastAPI
+from fastapi import FastAPI, Header
 from fastapi.responses import StreamingResponse
 
 chatqna_app = FastAPI()
 
 
+def route_pipeline(request: RagChatCompletionRequest, x_pipeline: Optional[str]) -> Optional[str]:
+    # Request field takes precedence over the X-Pipeline header
+    return request.pipeline if request.pipeline else x_pipeline
+
+
 # Retrieval
 @chatqna_app.post(path="/v1/retrieval")
-async def retrieval(request: ChatCompletionRequest):
-    nodeswithscore = ctx.get_pipeline_mgr().run_retrieve(chat_request=request)
+async def retrieval(request: RagChatCompletionRequest, x_pipeline: Optional[str] = Header(default=None)):
+    name = route_pipeline(request, x_pipeline)
+    pl = get_active_pipeline(name)
+    nodeswithscore = await ctx.get_pipeline_mgr().run_retrieve(chat_request=request, name=pl.idx)
+    if nodeswithscore == -1:
+        raise pipeline_not_active(name)
     print(nodeswithscore)
     if nodeswithscore is not None:
         ret = []
@@ -27,22 +38,31 @@ async def retrieval(request: ChatCompletionRequest):
 
 # ChatQnA
 @chatqna_app.post(path="/v1/chatqna")
-async def chatqna(request: ChatCompletionRequest):
-    generator = ctx.get_pipeline_mgr().get_active_pipeline().generator
-    if generator:
-        request.model = generator.model_id
+async def chatqna(request: RagChatCompletionRequest, x_pipeline: Optional[str] = Header(default=None)):
+    name = route_pipeline(request, x_pipeline)
+    pl = get_active_pipeline(name)
+    if pl.generator:
+        request.model = pl.generator.model_id
+    # Pin the resolved pipeline so that a concurrent switch does not affect this request
+    out = await ctx.get_pipeline_mgr().run_pipeline(chat_request=request, name=pl.idx)
+    if out == -1:
+        raise pipeline_not_active(name)
+    ret, retri_res = out
     if request.stream:
-        ret, retri_res = ctx.get_pipeline_mgr().run_pipeline(chat_request=request)
         return ret
     else:
-        ret, retri_res = ctx.get_pipeline_mgr().run_pipeline(chat_request=request)
         return str(ret)
 
 
 # RAGQnA
 @chatqna_app.post(path="/v1/ragqna")
-async def ragqna(request: ChatCompletionRequest):
-    res, retri_res = ctx.get_pipeline_mgr().run_pipeline(chat_request=request)
+async def ragqna(request: RagChatCompletionRequest, x_pipeline: Optional[str] = Header(default=None)):
+    name = route_pipeline(request, x_pipeline)
+    pl = get_active_pipeline(name)
+    out = await ctx.get_pipeline_mgr().run_pipeline(chat_request=request, name=pl.idx)
+    if out == -1:
+        raise pipeline_not_active(name)
+    res, retri_res = out
     if isinstance(res, GeneratedDoc):
         res = res.text
     elif isinstance(res, StreamingResponse):
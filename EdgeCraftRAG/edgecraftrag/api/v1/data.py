@@ -1,17 +1,21 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+from typing import Optional
+
+from edgecraftrag.api.v1 import get_active_pipeline, pipeline_not_active
 from edgecraftrag.api_schema import DataIn, FilesIn
 from edgecraftrag.context import ctx
-from fastapi import FastAPI
+from fastapi import FastAPI, Header
 
 data_app = FastAPI()
 
 
 # Upload a text or files
 @data_app.post(path="/v1/data")
-async def add_data(request: DataIn):
+async def add_data(request: DataIn, x_pipeline: Optional[str] = Header(default=None)):
     nodelist = None
+    pl = get_active_pipeline(x_pipeline)
 
     docs = []
     if request.text is not None:
@@ -19,10 +23,11 @@ async def add_data(request: DataIn):
     if request.local_path is not None:
         docs.extend(ctx.get_file_mgr().add_files(docs=request.local_path))
 
-    nodelist = ctx.get_pipeline_mgr().run_data_prepare(docs=docs)
+    nodelist = ctx.get_pipeline_mgr().run_data_prepare(docs=docs, name=pl.idx)
+    if nodelist == -1:
+        raise pipeline_not_active(x_pipeline)
     if nodelist is None:
         return "Error"
-    pl = ctx.get_pipeline_mgr().get_active_pipeline()
     # TODO: Need bug fix, when node_parser is None
     ctx.get_node_mgr().add_nodes(pl.node_parser.idx, nodelist)
     return "Done"
@@ -30,17 +35,19 @@ async def add_data(request: DataIn):
 
 # Upload files by a list of file_path
 @data_app.post(path="/v1/data/files")
-async def add_files(request: FilesIn):
+async def add_files(request: FilesIn, x_pipeline: Optional[str] = Header(default=None)):
     nodelist = None
+    pl = get_active_pipeline(x_pipeline)
 
     docs = []
     if request.local_paths is not None:
         docs.extend(ctx.get_file_mgr().add_files(docs=request.local_paths))
 
-    nodelist = ctx.get_pipeline_mgr().run_data_prepare(docs=docs)
+    nodelist = ctx.get_pipeline_mgr().run_data_prepare(docs=docs, name=pl.idx)
+    if nodelist == -1:
+        raise pipeline_not_active(x_pipeline)
     if nodelist is None:
         return "Error"
-    pl = ctx.get_pipeline_mgr().get_active_pipeline()
     # TODO: Need bug fix, when node_parser is None
     ctx.get_node_mgr().add_nodes(pl.node_parser.idx, nodelist)
     return "Done"
@@ -60,17 +67,24 @@ async def get_file_docs(name):
 
 # DELETE a file
 @data_app.delete(path="/v1/data/files/{name}")
-async def delete_file(name):
+async def delete_file(name, x_pipeline: Optional[str] = Header(default=None)):
+    pl = get_active_pipeline(x_pipeline)
+    deleted_docs = ctx.get_file_mgr().get_docs_by_file(name)
     if ctx.get_file_mgr().del_file(name):
         # TODO: delete the nodes related to the file
         all_docs = ctx.get_file_mgr().get_all_docs()
 
-        nodelist = ctx.get_pipeline_mgr().run_data_update(docs=all_docs)
+        nodelist = ctx.get_pipeline_mgr().run_data_update(docs=all_docs, name=pl.idx)
+        if nodelist == -1:
+            raise pipeline_not_active(x_pipeline)
         if nodelist is None:
             return "Error"
-        pl = ctx.get_pipeline_mgr().get_active_pipeline()
+        pl = get_active_pipeline(pl.idx)
+        # The pipeline has been switched to a rebuilt indexer
+        ctx.get_indexer_mgr().add(pl.indexer)
         ctx.get_node_mgr().del_nodes_by_np_idx(pl.node_parser.idx)
         ctx.get_node_mgr().add_nodes(pl.node_parser.idx, nodelist)
+        ctx.get_file_mgr().release_docs(deleted_docs)
         return f"File {name} is deleted"
     else:
         return f"File {name} not found"
@@ -78,7 +92,9 @@ async def delete_file(name):
 
 # UPDATE a file
 @data_app.patch(path="/v1/data/files/{name}")
-async def update_file(name, request: DataIn):
+async def update_file(name, request: DataIn, x_pipeline: Optional[str] = Header(default=None)):
+    pl = get_active_pipeline(x_pipeline)
+    deleted_docs = ctx.get_file_mgr().get_docs_by_file(name)
     # 1. Delete
     if ctx.get_file_mgr().del_file(name):
         # 2. Add
@@ -91,12 +107,17 @@ async def update_file(name, request: DataIn):
         # 3. Re-run the pipeline
         # TODO: update the nodes related to the file
         all_docs = ctx.get_file_mgr().get_all_docs()
-        nodelist = ctx.get_pipeline_mgr().run_data_update(docs=all_docs)
+        nodelist = ctx.get_pipeline_mgr().run_data_update(docs=all_docs, name=pl.idx)
+        if nodelist == -1:
+            raise pipeline_not_active(x_pipeline)
         if nodelist is None:
             return "Error"
-        pl = ctx.get_pipeline_mgr().get_active_pipeline()
+        pl = get_active_pipeline(pl.idx)
+        # The pipeline has been switched to a rebuilt indexer
+        ctx.get_indexer_mgr().add(pl.indexer)
         ctx.get_node_mgr().del_nodes_by_np_idx(pl.node_parser.idx)
         ctx.get_node_mgr().add_nodes(pl.node_parser.idx, nodelist)
+        ctx.get_file_mgr().release_docs(deleted_docs)
         return f"File {name} is updated"
     else:
         return f"File {name} not found"
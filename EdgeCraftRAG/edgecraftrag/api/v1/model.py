@@ -4,6 +4,7 @@
 import gc
 
 from edgecraftrag.api_schema import ModelIn
+from edgecraftrag.base import collect_garbage_later
 from edgecraftrag.context import ctx
 from fastapi import FastAPI
 
@@ -32,6 +33,7 @@ async def add_model(request: ModelIn):
         if model is None:
             model = modelmgr.load_model(request)
             modelmgr.add(model)
+        modelmgr.enforce_memory_budget(ctx.get_pipeline_mgr().get_active_pipelines())
     return model.model_id + " model loaded"
 
 
@@ -39,9 +41,8 @@ async def add_model(request: ModelIn):
 @model_app.patch(path="/v1/settings/models/{model_id:path}")
 async def update_model(model_id, request: ModelIn):
     # The process of patch model is : 1.delete model 2.create model
-    active_pl = ctx.get_pipeline_mgr().get_active_pipeline()
     modelmgr = ctx.get_model_mgr()
-    if active_pl and active_pl.model_existed(model_id):
+    if any(pl.model_existed(model_id) for pl in ctx.get_pipeline_mgr().get_active_pipelines()):
         return "Model is being used by active pipeline, unable to update model"
     else:
         async with modelmgr._lock:
@@ -52,7 +53,7 @@ async def update_model(model_id, request: ModelIn):
             model = modelmgr.search_model(request)
             if model is None:
                 modelmgr.del_model_by_name(model_id)
-                # Clean up memory occupation
+                # Free the old model before the new one is loaded
                 gc.collect()
                 # load new model
                 model = modelmgr.load_model(request)
@@ -63,14 +64,13 @@ async def update_model(model_id, request: ModelIn):
 # DELETE Model
 @model_app.delete(path="/v1/settings/models/{model_id:path}")
 async def delete_model(model_id):
-    active_pl = ctx.get_pipeline_mgr().get_active_pipeline()
-    if active_pl and active_pl.model_existed(model_id):
+    if any(pl.model_existed(model_id) for pl in ctx.get_pipeline_mgr().get_active_pipelines()):
         return "Model is being used by active pipeline, unable to remove"
     else:
         modelmgr = ctx.get_model_mgr()
         # Currently use asyncio.Lock() to deal with multi-requests
         async with modelmgr._lock:
             response = modelmgr.del_model_by_name(model_id)
-            # Clean up memory occupation
-            gc.collect()
+            # Clean up memory occupation without holding the request
+            collect_garbage_later()
         return response
@@ -1,10 +1,19 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
 import weakref
 
 from edgecraftrag.api_schema import PipelineCreateIn
-from edgecraftrag.base import IndexerType, InferenceType, ModelType, NodeParserType, PostProcessorType, RetrieverType
+from edgecraftrag.base import (
+    CallbackType,
+    IndexerType,
+    InferenceType,
+    ModelType,
+    NodeParserType,
+    PostProcessorType,
+    RetrieverType,
+)
 from edgecraftrag.components.benchmark import Benchmark
 from edgecraftrag.components.generator import QnAGenerator
 from edgecraftrag.components.indexer import VectorIndexer
@@ -48,8 +57,7 @@ async def add_pipeline(request: PipelineCreateIn):
     pl = ctx.get_pipeline_mgr().get_pipeline_by_name_or_id(request.name)
     if pl is None:
         pl = ctx.get_pipeline_mgr().create_pipeline(request.name)
-    active_pl = ctx.get_pipeline_mgr().get_active_pipeline()
-    if pl == active_pl:
+    if pl.status.active:
         if not request.active:
             pass
         else:
@@ -68,13 +76,16 @@ async def update_pipeline(name, request: PipelineCreateIn):
     pl = ctx.get_pipeline_mgr().get_pipeline_by_name_or_id(name)
     if pl is None:
         return "Pipeline not exists"
-    active_pl = ctx.get_pipeline_mgr().get_active_pipeline()
-    if pl == active_pl:
-        if not request.active:
-            pass
-        else:
-            return "Unable to patch an active pipeline..."
     async with ctx.get_pipeline_mgr()._lock:
+        if pl.status.active and request.active:
+            # Build the new version in the background and swap it in when it is ready
+            try:
+                new_pl = await asyncio.to_thread(build_pipeline_version, pl, request)
+            except ValueError as e:
+                return str(e)
+            ctx.get_pipeline_mgr().swap_pipeline(pl, new_pl)
+            ctx.get_model_mgr().enforce_memory_budget(ctx.get_pipeline_mgr().get_active_pipelines())
+            return new_pl
         try:
             update_pipeline_handler(pl, request)
         except ValueError as e:
@@ -88,6 +99,22 @@ async def remove_pipeline(name):
     return ctx.get_pipeline_mgr().remove_pipeline_by_name_or_id(name)
 
 
+def build_pipeline_version(pl, req):
+    new_pl = pl.copy_for_update()
+    ret = update_pipeline_handler(new_pl, req)
+    if isinstance(ret, str):
+        raise ValueError(ret)
+    if new_pl.node_parser is not pl.node_parser or new_pl.indexer is not pl.indexer:
+        # Re-index all files into a fresh copy of the indexer of the new version
+        nodelist = new_pl.run(cbtype=CallbackType.DATAUPDATE, docs=ctx.get_file_mgr().get_all_docs())
+        if nodelist is not None:
+            ctx.get_indexer_mgr().add(new_pl.indexer)
+            ctx.get_node_mgr().del_nodes_by_np_idx(new_pl.node_parser.idx)
+            ctx.get_node_mgr().add_nodes(new_pl.node_parser.idx, nodelist)
+    new_pl.warm_up()
+    return new_pl
+
+
 def update_pipeline_handler(pl, req):
     if req.node_parser is not None:
         np = req.node_parser
@@ -114,7 +141,9 @@ def update_pipeline_handler(pl, req):
                 case NodeParserType.SENTENCEWINDOW:
                     pl.node_parser = SWindowNodeParser.from_defaults(window_size=np.window_size)
                 case NodeParserType.UNSTRUCTURED:
-                    pl.node_parser = UnstructedNodeParser(chunk_size=np.chunk_size, chunk_overlap=np.chunk_overlap)
+                    pl.node_parser = UnstructedNodeParser(
+                        chunk_size=np.chunk_size, chunk_overlap=np.chunk_overlap, strategy=np.strategy
+                    )
             ctx.get_node_parser_mgr().add(pl.node_parser)
 
     if req.indexer is not None:
@@ -197,12 +226,26 @@ def update_pipeline_handler(pl, req):
                 ctx.get_model_mgr().add(model)
             # Use weakref to achieve model deletion and memory release
             model_ref = weakref.ref(model)
-            pl.generator = QnAGenerator(model_ref, gen.prompt_path, gen.inference_type)
+            pl.generator = QnAGenerator(
+                model_ref,
+                gen.prompt_path,
+                gen.inference_type,
+                context_separator=gen.context_separator,
+                source_marker=gen.source_marker,
+                max_context_tokens=gen.max_context_tokens,
+            )
 
             pl.benchmark = Benchmark(pl.enable_benchmark, gen.inference_type)
+            pl.benchmark.retrieval_cache = pl.retrieval_cache
         else:
             return "Inference Type Not Supported"
 
+    if req.max_concurrency is not None:
+        pl.set_max_concurrency(req.max_concurrency)
+
     if pl.status.active != req.active:
         ctx.get_pipeline_mgr().activate_pipeline(pl.name, req.active, ctx.get_node_mgr())
+        unloaded = ctx.get_model_mgr().enforce_memory_budget(ctx.get_pipeline_mgr().get_active_pipelines())
+        if unloaded:
+            print(f"Models unloaded to fit in memory budget: {unloaded}")
     return pl
@@ -3,6 +3,7 @@
 
 from typing import Optional
 
+from comps.cores.proto.api_protocol import ChatCompletionRequest
 from pydantic import BaseModel
 
 
@@ -20,6 +21,7 @@ class NodeParserIn(BaseModel):
     chunk_sizes: Optional[list] = None
     parser_type: str
     window_size: Optional[int] = 3
+    strategy: Optional[str] = "hi_res"
 
 
 class IndexerIn(BaseModel):
@@ -42,6 +44,9 @@ class GeneratorIn(BaseModel):
     prompt_path: Optional[str] = None
     model: Optional[ModelIn] = None
     inference_type: Optional[str] = "local"
+    context_separator: Optional[str] = ""
+    source_marker: Optional[bool] = False
+    max_context_tokens: Optional[int] = None
 
 
 class PipelineCreateIn(BaseModel):
@@ -52,6 +57,7 @@ class PipelineCreateIn(BaseModel):
     postprocessor: Optional[list[PostProcessorIn]] = None
     generator: Optional[GeneratorIn] = None
     active: Optional[bool] = False
+    max_concurrency: Optional[int] = None
 
 
 class DataIn(BaseModel):
@@ -67,3 +73,10 @@ class RagOut(BaseModel):
     query: str
     contexts: Optional[list[str]] = None
     response: str
+
+
+class RagChatCompletionRequest(ChatCompletionRequest):
+    # name or id of the active pipeline to serve the request, default pipeline if None
+    pipeline: Optional[str] = None
+    # stream citations of retrieved nodes after the llm response
+    include_citations: Optional[bool] = True
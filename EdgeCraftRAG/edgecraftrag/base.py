@@ -2,6 +2,8 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import abc
+import gc
+import threading
 import uuid
 from enum import Enum
 from typing import Any, Callable, List, Optional
@@ -111,18 +113,78 @@ class BaseComponent(BaseModel):
 class BaseMgr:
 
     def __init__(self):
+        # Components by idx and by name. Both dicts are never mutated in place
+        # but copied and replaced under the write lock, so readers see a
+        # consistent snapshot without taking any lock
         self.components = {}
+        self._names = {}
+        self._write_lock = threading.Lock()
+
+    def get_name(self, comp: BaseComponent) -> str:
+        return comp.name
 
     def add(self, comp: BaseComponent):
-        self.components[comp.idx] = comp
+        with self._write_lock:
+            components = dict(self.components)
+            old = components.get(comp.idx)
+            components[comp.idx] = comp
+            names = dict(self._names)
+            if old is not None and names.get(self.get_name(old)) is old:
+                del names[self.get_name(old)]
+            name = self.get_name(comp)
+            if name and name not in names:
+                # Like a scan of the components, the first added one wins
+                names[name] = comp
+            self.components = components
+            self._names = names
 
     def get(self, idx: str) -> BaseComponent:
-        if idx in self.components:
-            return self.components[idx]
-        else:
-            return None
+        return self.components.get(idx)
+
+    def get_by_name(self, name: str) -> BaseComponent:
+        return self._names.get(name)
+
+    def get_by_name_or_id(self, name: str) -> BaseComponent:
+        comp = self._names.get(name)
+        return comp if comp is not None else self.components.get(name)
 
     def remove(self, idx):
         # remove the reference count
         # after reference count == 0, object memory can be freed with Garbage Collector
-        del self.components[idx]
+        with self._write_lock:
+            components = dict(self.components)
+            comp = components.pop(idx)
+            names = dict(self._names)
+            name = self.get_name(comp)
+            if names.get(name) is comp:
+                del names[name]
+                for v in components.values():
+                    if self.get_name(v) == name:
+                        names[name] = v
+                        break
+            self.components = components
+            self._names = names
+
+
+_gc_lock = threading.Lock()
+_gc_scheduled = False
+
+
+def collect_garbage_later(delay: float = 1.0):
+    """Run a full garbage collection in the background, so that requests
+    never wait for it. Removals in a burst share a single collection."""
+    global _gc_scheduled
+    with _gc_lock:
+        if _gc_scheduled:
+            return
+        _gc_scheduled = True
+
+    def collect():
+        global _gc_scheduled
+        with _gc_lock:
+            _gc_scheduled = False
+        gc.collect()
+
+    timer = threading.Timer(delay, collect)
+    timer.daemon = True
+    timer.start()
@@ -9,6 +9,35 @@ from edgecraftrag.base import BaseComponent, CompType, InferenceType, ModelType
 from prometheus_client.parser import text_string_to_metric_families
 from pydantic import BaseModel, Field, model_serializer
 
+# Histogram bucket upper bounds (seconds), last bucket catches everything else
+TTFT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+ITL_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, float("inf"))
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        return {
+            "buckets": {("+Inf" if b == float("inf") else str(b)): c for b, c in zip(self.buckets, self.counts)},
+            "count": self.count,
+            "sum": self.sum,
+            "average": self.sum / self.count if self.count > 0 else None,
+        }
+
 
 class Benchmark(BaseComponent):
 
@@ -19,6 +48,10 @@ class Benchmark(BaseComponent):
 
         self.benchmark_data_list = {}
         self.llm_data_list = {}
+        self.token_data_list = {}
+        self.ttft_histogram = Histogram(TTFT_BUCKETS)
+        self.itl_histogram = Histogram(ITL_BUCKETS)
+        self.retrieval_cache = None
 
         self.last_idx = 0
 
@@ -47,6 +80,16 @@ class Benchmark(BaseComponent):
         if self.is_enabled() and idx in self.benchmark_data_list and comp_type in self.benchmark_data_list[idx]:
             self.benchmark_data_list[idx][comp_type] = end - start
 
+    def update_response_data(self, idx, response_bytes, citation_time):
+        # citation_time: time spent to serialize and send citations after the last token
+        if self.is_enabled() and idx in self.benchmark_data_list:
+            self.benchmark_data_list[idx]["response_bytes"] = response_bytes
+            self.benchmark_data_list[idx]["citation_time"] = citation_time
+
+    def update_cache_hit(self, idx, hit):
+        if self.is_enabled() and idx in self.benchmark_data_list:
+            self.benchmark_data_list[idx]["retrieval_cache_hit"] = hit
+
     def insert_llm_data(self, idx):
         if self.is_enabled():
             if self.is_vllm:
@@ -55,24 +98,44 @@ class Benchmark(BaseComponent):
                 metrics = None
             self.llm_data_list[idx] = metrics
 
+    def insert_token_data(self, idx, start, token_times):
+        """Record streaming latency of one request
+        :param idx: benchmark index of the request
+        :param start: perf_counter() timestamp when generation was started
+        :param token_times: perf_counter() timestamps of every streamed token."""
+        if not self.is_enabled() or not token_times:
+            return
+        ttft = token_times[0] - start
+        gaps = [b - a for a, b in zip(token_times, token_times[1:])]
+        decode_time = token_times[-1] - token_times[0]
+        self.ttft_histogram.observe(ttft)
+        for gap in gaps:
+            self.itl_histogram.observe(gap)
+        self.token_data_list[idx] = {
+            "time_to_first_token_seconds": ttft,
+            "average_inter_token_latency_seconds": sum(gaps) / len(gaps) if gaps else None,
+            "max_inter_token_latency_seconds": max(gaps) if gaps else None,
+            "generated_tokens": len(token_times),
+            "tokens_per_second": (len(token_times) - 1) / decode_time if decode_time > 0 else None,
+        }
+
     @model_serializer
     def ser_model(self):
         if self.enabled:
+            set = {
+                "Benchmark enabled": self.enabled,
+                "last_benchmark_data": (
+                    self.benchmark_data_list[self.last_idx] if self.last_idx in self.benchmark_data_list else None
+                ),
+                "last_token_data": (
+                    self.token_data_list[self.last_idx] if self.last_idx in self.token_data_list else None
+                ),
+                "time_to_first_token_histogram": self.ttft_histogram.to_dict(),
+                "inter_token_latency_histogram": self.itl_histogram.to_dict(),
+                "retrieval_cache": self.retrieval_cache.stats() if self.retrieval_cache else None,
+            }
             if self.is_vllm:
-                set = {
-                    "Benchmark enabled": self.enabled,
-                    "last_benchmark_data": (
-                        self.benchmark_data_list[self.last_idx] if self.last_idx in self.benchmark_data_list else None
-                    ),
-                    "vllm_metrics": self.llm_data_list[self.last_idx] if self.last_idx in self.llm_data_list else None,
-                }
-            else:
-                set = {
-                    "Benchmark enabled": self.enabled,
-                    "last_benchmark_data": (
-                        self.benchmark_data_list[self.last_idx] if self.last_idx in self.benchmark_data_list else None
-                    ),
-                }
+                set["vllm_metrics"] = self.llm_data_list[self.last_idx] if self.last_idx in self.llm_data_list else None
         else:
             set = {
                 "Benchmark enabled": self.enabled,
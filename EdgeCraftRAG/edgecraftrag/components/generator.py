@@ -5,41 +5,133 @@ import asyncio
 import dataclasses
 import json
 import os
+import re
 
+import httpx
+import orjson
 from comps import GeneratedDoc
-from edgecraftrag.base import BaseComponent, CompType, GeneratorType
+from edgecraftrag.base import BaseComponent, CompType, GeneratorType, InferenceType
 from fastapi.responses import StreamingResponse
 from langchain_core.prompts import PromptTemplate
 from llama_index.llms.openai_like import OpenAILike
 from pydantic import model_serializer
-from unstructured.staging.base import elements_from_base64_gzipped_json
 
+# Every streamed llm delta starts with this prefix, see stream_generator
+LLM_RES_PREFIX = '{"llm_res"'
 
-async def stream_generator(llm, prompt_str, retrieved_nodes=[], text_gen_context=""):
+
+def build_citation(node, snippet_chars=200, max_images=2):
+    """Build a compact citation of a retrieved node without touching the shared node
+    :param node: NodeWithScore
+    :param snippet_chars: max number of characters of the node text to include
+    :param max_images: max number of image paths to include
+    :return: citation dict."""
+    metadata = node.node.metadata
+    citation = {
+        "node_id": node.node.node_id,
+        "score": float(node.score) if node.score is not None else None,
+        "filename": metadata.get("filename", metadata.get("file_name")),
+        "snippet": node.node.get_content()[:snippet_chars],
+    }
+    page = metadata.get("page_number", metadata.get("page_label"))
+    if page is not None:
+        citation["page_number"] = page
+    if "link_urls" in metadata:
+        citation["link_urls"] = metadata["link_urls"]
+    # Image paths are extracted from the original elements at indexing time
+    if metadata.get("image_paths") and max_images > 0:
+        citation["image_paths"] = metadata["image_paths"][:max_images]
+    return citation
+
+
+def stream_citations(retrieved_nodes, text_gen_context):
+    snippet_chars = int(os.getenv("CITATION_SNIPPET_CHARS", 200))
+    for node in retrieved_nodes:
+        yield orjson.dumps(build_citation(node, snippet_chars)).decode()
+    yield orjson.dumps({"retrieved_text": text_gen_context}).decode()
+
+
+async def stream_generator(llm, prompt_str, retrieved_nodes=[], text_gen_context="", include_citations=True):
     response = llm.stream_complete(prompt_str)
     for r in response:
         yield json.dumps({"llm_res": r.delta})
         await asyncio.sleep(0)
-    for node in retrieved_nodes:
-        node.node.metadata["score"] = float(node.score)
-        yield json.dumps(node.node.metadata)
-        await asyncio.sleep(0)
-    yield json.dumps({"retrieved_text": text_gen_context})
+    if include_citations:
+        for citation in stream_citations(retrieved_nodes, text_gen_context):
+            yield citation
+            await asyncio.sleep(0)
+
+
+async def astream_generator(llm, prompt_str, retrieved_nodes=[], text_gen_context="", include_citations=True, **kwargs):
+    response = await llm.astream_complete(prompt_str, **kwargs)
+    async for r in response:
+        yield json.dumps({"llm_res": r.delta})
+    if include_citations:
+        for citation in stream_citations(retrieved_nodes, text_gen_context):
+            yield citation
+            await asyncio.sleep(0)
+
+
+class DrainingStream(httpx.AsyncByteStream):
+    """Response stream reading the rest of the body before it is closed
+
+    OpenAI clients stop reading a stream at [DONE] and close it, the connection
+    is then dropped instead of going back to the pool since the end of the
+    chunked body is still unread."""
+
+    def __init__(self, stream, max_bytes=64 * 1024, timeout=1.0):
+        self._stream = stream
+        self._max_bytes = max_bytes
+        self._timeout = timeout
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        drained = 0
+        try:
+            async with asyncio.timeout(self._timeout):
+                async for chunk in self._stream:
+                    drained += len(chunk)
+                    if drained > self._max_bytes:
+                        break
+        except (TimeoutError, httpx.HTTPError):
+            pass
+        await self._stream.aclose()
+
+
+class DrainingTransport(httpx.AsyncHTTPTransport):
+
+    async def handle_async_request(self, request):
+        response = await super().handle_async_request(request)
+        response.stream = DrainingStream(response.stream)
+        return response
 
 
 class QnAGenerator(BaseComponent):
 
-    def __init__(self, llm_model, prompt_template, inference_type, **kwargs):
+    def __init__(
+        self,
+        llm_model,
+        prompt_template,
+        inference_type,
+        context_separator="",
+        source_marker=False,
+        max_context_tokens=None,
+        **kwargs,
+    ):
         BaseComponent.__init__(
             self,
             comp_type=CompType.GENERATOR,
             comp_subtype=GeneratorType.CHATQNA,
         )
         self.inference_type = inference_type
-        self._REPLACE_PAIRS = (
-            ("\n\n", "\n"),
-            ("\t\n", "\n"),
-        )
+        # Same result as replacing "\n\n" then "\t\n" by "\n", in a single pass
+        self._CLEAN_PATTERN = re.compile(r"\t?\n\n|\t\n")
+        self.context_separator = context_separator
+        self.source_marker = source_marker
+        self.max_context_tokens = max_context_tokens
         safe_root = "/templates"
         template = os.path.normpath(os.path.join(safe_root, prompt_template))
         if not template.startswith(safe_root):
@@ -52,22 +144,44 @@ class QnAGenerator(BaseComponent):
             self.model_id = llm_model
         else:
             self.model_id = llm_model().model_id
+        # Long-lived vLLM client, created on first use and shared by all requests
+        self._vllm_client = None
 
     def clean_string(self, string):
-        ret = string
-        for p in self._REPLACE_PAIRS:
-            ret = ret.replace(*p)
-        return ret
+        return self._CLEAN_PATTERN.sub("\n", string)
+
+    def count_tokens(self, text):
+        tokenizer = getattr(self.llm(), "_tokenizer", None) if self.inference_type == InferenceType.LOCAL else None
+        if tokenizer is not None:
+            return len(tokenizer.encode(text, add_special_tokens=False))
+        # Rough estimation when the tokenizer is not available locally
+        return len(text) // 4 + 1
+
+    def build_context(self, retrieved_nodes):
+        """Build the context from retrieved nodes in a single pass
+        :param retrieved_nodes: List of retrieved nodes
+        :return: Context string, nodes beyond max_context_tokens are dropped."""
+        parts = []
+        used_tokens = 0
+        for i, n in enumerate(retrieved_nodes):
+            text = self.clean_string(n.node.get_text().strip())
+            if self.source_marker:
+                metadata = n.node.metadata
+                source = metadata.get("filename", metadata.get("file_name"))
+                text = f"[{i + 1}] {source}\n{text}" if source else f"[{i + 1}]\n{text}"
+            if self.max_context_tokens:
+                used_tokens += self.count_tokens(text)
+                if used_tokens > self.max_context_tokens and parts:
+                    break
+            parts.append(text)
+        return self.context_separator.join(parts)
 
     def query_transform(self, chat_request, retrieved_nodes):
         """Generate text_gen_context and prompt_str
         :param chat_request: Request object
         :param retrieved_nodes: List of retrieved nodes
         :return: Generated text_gen_context and prompt_str."""
-        text_gen_context = ""
-        for n in retrieved_nodes:
-            origin_text = n.node.get_text()
-            text_gen_context += self.clean_string(origin_text.strip())
+        text_gen_context = self.build_context(retrieved_nodes)
         query = chat_request.messages
         prompt_str = self.prompt.format(input=query, context=text_gen_context)
         return text_gen_context, prompt_str
@@ -90,37 +204,70 @@ class QnAGenerator(BaseComponent):
         self.llm().max_new_tokens = chat_request.max_tokens
         if chat_request.stream:
             return StreamingResponse(
-                stream_generator(self.llm(), prompt_str, retrieved_nodes, text_gen_context),
+                stream_generator(
+                    self.llm(),
+                    prompt_str,
+                    retrieved_nodes,
+                    text_gen_context,
+                    include_citations=getattr(chat_request, "include_citations", True),
+                ),
                 media_type="text/event-stream",
             )
         else:
             return self.llm().complete(prompt_str)
 
+    def get_vllm_client(self):
+        if self._vllm_client is None:
+            llm_endpoint = os.getenv("vLLM_ENDPOINT", "http://localhost:8008")
+            timeout = httpx.Timeout(
+                float(os.getenv("vLLM_TIMEOUT", 600)), connect=float(os.getenv("vLLM_CONNECT_TIMEOUT", 10))
+            )
+            limits = httpx.Limits(
+                max_connections=int(os.getenv("vLLM_MAX_CONNECTIONS", 64)),
+                max_keepalive_connections=int(os.getenv("vLLM_MAX_KEEPALIVE_CONNECTIONS", 16)),
+                keepalive_expiry=float(os.getenv("vLLM_KEEPALIVE_EXPIRY", 60)),
+            )
+            self._vllm_client = OpenAILike(
+                api_key="fake",
+                api_base=llm_endpoint + "/v1",
+                model=self.llm().model_id,
+                timeout=timeout.read,
+                http_client=httpx.Client(timeout=timeout, limits=limits),
+                async_http_client=httpx.AsyncClient(timeout=timeout, transport=DrainingTransport(limits=limits)),
+            )
+        return self._vllm_client
+
     def run_vllm(self, chat_request, retrieved_nodes, **kwargs):
         if self.llm is None:
             return "No LLM provided, please provide model_id_or_path"
         # query transformation
         text_gen_context, prompt_str = self.query_transform(chat_request, retrieved_nodes)
-        llm_endpoint = os.getenv("vLLM_ENDPOINT", "http://localhost:8008")
-        model_name = self.llm().model_id
-        llm = OpenAILike(
-            api_key="fake",
-            api_base=llm_endpoint + "/v1",
+        llm = self.get_vllm_client()
+        # Sampling parameters are passed per call so that the client can be shared
+        sampling_kwargs = dict(
             max_tokens=chat_request.max_tokens,
-            model=model_name,
             top_p=chat_request.top_p,
-            top_k=chat_request.top_k,
             temperature=chat_request.temperature,
-            streaming=chat_request.stream,
-            repetition_penalty=chat_request.repetition_penalty,
+            extra_body={
+                "top_k": chat_request.top_k,
+                "repetition_penalty": chat_request.repetition_penalty,
+            },
         )
 
         if chat_request.stream:
             return StreamingResponse(
-                stream_generator(llm, prompt_str, retrieved_nodes, text_gen_context), media_type="text/event-stream"
+                astream_generator(
+                    llm,
+                    prompt_str,
+                    retrieved_nodes,
+                    text_gen_context,
+                    include_citations=getattr(chat_request, "include_citations", True),
+                    **sampling_kwargs,
+                ),
+                media_type="text/event-stream",
             )
         else:
-            response = llm.complete(prompt_str)
+            response = llm.complete(prompt_str, **sampling_kwargs)
             response = response.text
 
             return GeneratedDoc(text=response, prompt=prompt_str)
@@ -1,6 +1,7 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import itertools
 from typing import Any
 
 import faiss
@@ -9,6 +10,9 @@ from llama_index.core import StorageContext, VectorStoreIndex
 from llama_index.vector_stores.faiss import FaissVectorStore
 from pydantic import model_serializer
 
+# Index versions are unique across indexers, including clones of an indexer
+_index_version = itertools.count(1)
+
 
 class VectorIndexer(BaseComponent, VectorStoreIndex):
 
@@ -27,22 +31,43 @@ class VectorIndexer(BaseComponent, VectorStoreIndex):
         self._initialize_indexer(embed_model, vector_type)
 
     def _initialize_indexer(self, embed_model, vector_type):
+        self.version = next(_index_version)
         match vector_type:
             case IndexerType.DEFAULT_VECTOR:
                 VectorStoreIndex.__init__(self, embed_model=embed_model, nodes=[])
             case IndexerType.FAISS_VECTOR:
                 if embed_model:
-                    d = embed_model._model.request.outputs[0].get_partial_shape()[2].get_length()
+                    # Read from the IR model since the compiled model may not exist yet
+                    d = embed_model._model.model.outputs[0].get_partial_shape()[2].get_length()
                 else:
                     d = 128
                 faiss_index = faiss.IndexFlatL2(d)
                 faiss_store = StorageContext.from_defaults(vector_store=FaissVectorStore(faiss_index=faiss_index))
                 VectorStoreIndex.__init__(self, embed_model=embed_model, nodes=[], storage_context=faiss_store)
 
+    def insert_nodes(self, nodes, **insert_kwargs):
+        VectorStoreIndex.insert_nodes(self, nodes, **insert_kwargs)
+        self.version = next(_index_version)
+
+    def delete_nodes(self, node_ids, delete_from_docstore=False, **delete_kwargs):
+        VectorStoreIndex.delete_nodes(self, node_ids, delete_from_docstore=delete_from_docstore, **delete_kwargs)
+        self.version = next(_index_version)
+
+    def delete_ref_doc(self, ref_doc_id, delete_from_docstore=False, **delete_kwargs):
+        VectorStoreIndex.delete_ref_doc(self, ref_doc_id, delete_from_docstore=delete_from_docstore, **delete_kwargs)
+        self.version = next(_index_version)
+
     def reinitialize_indexer(self):
         if self.comp_subtype == IndexerType.FAISS_VECTOR:
             self._initialize_indexer(self.model, IndexerType.FAISS_VECTOR)
 
+    def clone(self):
+        # Empty indexer with the same configuration and idx, to be filled
+        # while this one keeps serving requests
+        indexer = VectorIndexer(self.model, self.comp_subtype)
+        indexer.idx = self.idx
+        return indexer
+
     def run(self, **kwargs) -> Any:
         pass
 
@@ -1,6 +1,9 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import hashlib
+import os
+import time
 from pathlib import Path
 from typing import Any, Optional
 
@@ -20,16 +23,76 @@ def model_exist(model_path):
     )
 
 
+def model_size(model_path):
+    # Size of the OpenVINO IR weights, used as an estimate of the resident size
+    model_dir = Path(model_path)
+    if not model_path or not model_dir.is_dir():
+        return 0
+    return sum(f.stat().st_size for f in model_dir.glob("*.bin"))
+
+
+def model_cache_dir(model_path, device, weight):
+    # Compiled blobs depend on the model, the target device and the precision
+    if os.getenv("ENABLE_OV_CACHE", "True").lower() != "true":
+        return None
+    cache_root = os.getenv("OV_CACHE_DIR", os.path.expanduser("~/.cache/edgecraftrag/ov_cache"))
+    key = hashlib.sha1(f"{os.path.abspath(model_path)}|{device}|{weight}".encode()).hexdigest()[:16]
+    return os.path.join(cache_root, f"{Path(model_path).name}_{str(device).lower()}_{key}")
+
+
+def ov_model_kwargs(model_path, device, weight):
+    model_kwargs = {}
+    # Compile the model on first inference instead of at load time
+    if os.getenv("LAZY_MODEL_COMPILE", "True").lower() == "true":
+        model_kwargs["compile"] = False
+    cache_dir = model_cache_dir(model_path, device, weight)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        model_kwargs["ov_config"] = {"CACHE_DIR": cache_dir}
+    return model_kwargs
+
+
 class BaseModelComponent(BaseComponent):
 
     model_id: Optional[str] = Field(default="")
     model_path: Optional[str] = Field(default="")
     weight: Optional[str] = Field(default="")
     device: Optional[str] = Field(default="cpu")
+    load_time: Optional[float] = Field(default=None)
+    compile_time: Optional[float] = Field(default=None)
+    compile_cache_hit: Optional[bool] = Field(default=None)
+    size: Optional[int] = Field(default=0)
 
     def run(self, **kwargs) -> Any:
         pass
 
+    def is_loaded(self) -> bool:
+        # The model is resident once it is compiled for its device
+        model = getattr(self, "_model", None)
+        return model is not None and getattr(model, "request", None) is not None
+
+    def resident_size(self) -> int:
+        return self.size if self.is_loaded() else 0
+
+    def compile_model(self):
+        """Compile the model for its device ahead of the first inference
+        :return: compile time in seconds, None if nothing had to be compiled."""
+        model = getattr(self, "_model", None)
+        if model is None or self.is_loaded():
+            return None
+        cache_dir = model.ov_config.get("CACHE_DIR") if getattr(model, "ov_config", None) else None
+        self.compile_cache_hit = bool(cache_dir and os.path.isdir(cache_dir) and os.listdir(cache_dir))
+        start = time.perf_counter()
+        model.compile()
+        self.compile_time = time.perf_counter() - start
+        return self.compile_time
+
+    def unload(self):
+        # Release the compiled model, it is compiled again on next inference
+        model = getattr(self, "_model", None)
+        if model is not None and self.is_loaded():
+            model.clear_requests()
+
     @model_serializer
     def ser_model(self):
         set = {
@@ -48,13 +111,19 @@ class OpenVINOEmbeddingModel(BaseModelComponent, OpenVINOEmbedding):
     def __init__(self, model_id, model_path, device, weight):
         if not model_exist(model_path):
             OpenVINOEmbedding.create_and_save_openvino_model(model_id, model_path)
-        OpenVINOEmbedding.__init__(self, model_id_or_path=model_path, device=device)
+        OpenVINOEmbedding.__init__(
+            self,
+            model_id_or_path=model_path,
+            device=device,
+            model_kwargs=ov_model_kwargs(model_path, device, weight),
+        )
         self.comp_type = CompType.MODEL
         self.comp_subtype = ModelType.EMBEDDING
         self.model_id = model_id
         self.model_path = model_path
         self.device = device
         self.weight = ""
+        self.size = model_size(model_path)
 
 
 class OpenVINORerankModel(BaseModelComponent, OpenVINORerank):
@@ -66,6 +135,7 @@ class OpenVINORerankModel(BaseModelComponent, OpenVINORerank):
             self,
             model_id_or_path=model_path,
             device=device,
+            model_kwargs=ov_model_kwargs(model_path, device, weight),
         )
         self.comp_type = CompType.MODEL
         self.comp_subtype = ModelType.RERANKER
@@ -73,6 +143,7 @@ class OpenVINORerankModel(BaseModelComponent, OpenVINORerank):
         self.model_path = model_path
         self.device = device
         self.weight = ""
+        self.size = model_size(model_path)
 
 
 class OpenVINOLLMModel(BaseModelComponent, OpenVINOLLM):
@@ -82,6 +153,7 @@ class OpenVINOLLMModel(BaseModelComponent, OpenVINOLLM):
             self,
             model_id_or_path=model_path,
             device_map=device,
+            model_kwargs=ov_model_kwargs(model_path, device, weight),
         )
         self.comp_type = CompType.MODEL
         self.comp_subtype = ModelType.LLM
@@ -89,3 +161,4 @@ class OpenVINOLLMModel(BaseModelComponent, OpenVINOLLM):
         self.model_path = model_path
         self.device = device
         self.weight = weight
+        self.size = model_size(model_path)
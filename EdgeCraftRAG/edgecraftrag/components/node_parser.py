@@ -1,14 +1,22 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import Any
+import os
+import time
+from array import array
+from typing import Any, ClassVar, List, Optional
 
 from edgecraftrag.base import BaseComponent, CompType, NodeParserType
-from edgecraftrag.utils import IMG_OUTPUT_DIR, DocxParagraphPicturePartitioner
+from edgecraftrag.utils import IMG_OUTPUT_DIR, DocxParagraphPicturePartitioner, image_saves
 from llama_index.core.node_parser import HierarchicalNodeParser, SentenceSplitter, SentenceWindowNodeParser
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import BaseNode, Document
 from llama_index.readers.file import UnstructuredReader
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LTFigure, LTImage, LTTextContainer
 from pydantic import model_serializer
 from unstructured.partition.docx import register_picture_partitioner
+from unstructured.staging.base import elements_from_base64_gzipped_json
 
 
 class SimpleNodeParser(BaseComponent, SentenceSplitter):
@@ -63,6 +71,47 @@ class HierarchyNodeParser(BaseComponent, HierarchicalNodeParser):
         return set
 
 
+# Node metadata locating the sentence window in the sentence store
+WINDOW_DOC_KEY = "window_doc_id"
+WINDOW_START_KEY = "window_start"
+WINDOW_END_KEY = "window_end"
+
+
+class SentenceStore:
+    """Sentences of each document stored once, windows are rebuilt from
+    sentence offsets instead of being copied into every node."""
+
+    def __init__(self):
+        # doc_id -> (concatenated sentences, sentence boundaries)
+        self._docs = {}
+
+    def add(self, doc_id: str, sentences: List[str]):
+        offsets = array("Q", [0])
+        pos = 0
+        for sentence in sentences:
+            pos += len(sentence)
+            offsets.append(pos)
+        self._docs[doc_id] = ("".join(sentences), offsets)
+
+    def remove(self, doc_id: str):
+        self._docs.pop(doc_id, None)
+
+    def get_window(self, doc_id: str, start: int, end: int) -> Optional[str]:
+        """Rebuild a sentence window
+        :param doc_id: id of the document the sentences belong to
+        :param start: index of the first sentence
+        :param end: index after the last sentence
+        :return: the window text, None if the document is unknown."""
+        entry = self._docs.get(doc_id)
+        if entry is None:
+            return None
+        text, offsets = entry
+        return " ".join(text[offsets[i] : offsets[i + 1]] for i in range(start, end))
+
+
+sentence_store = SentenceStore()
+
+
 class SWindowNodeParser(BaseComponent, SentenceWindowNodeParser):
 
     def __init__(self, **kwargs):
@@ -77,6 +126,24 @@ class SWindowNodeParser(BaseComponent, SentenceWindowNodeParser):
 
         return None
 
+    def build_window_nodes_from_documents(self, documents: List[Document]) -> List[BaseNode]:
+        # Keep only the window offsets in node metadata, the window text is
+        # rebuilt from the sentence store by MetadataReplaceProcessor
+        window_keys = [WINDOW_DOC_KEY, WINDOW_START_KEY, WINDOW_END_KEY]
+        all_nodes = []
+        for doc in documents:
+            text_splits = self.sentence_splitter(doc.text)
+            nodes = build_nodes_from_splits(text_splits, doc, id_func=self.id_func)
+            sentence_store.add(doc.doc_id, [node.text for node in nodes])
+            for i, node in enumerate(nodes):
+                node.metadata[WINDOW_DOC_KEY] = doc.doc_id
+                node.metadata[WINDOW_START_KEY] = max(0, i - self.window_size)
+                node.metadata[WINDOW_END_KEY] = min(i + self.window_size + 1, len(nodes))
+                node.excluded_embed_metadata_keys.extend(window_keys)
+                node.excluded_llm_metadata_keys.extend(window_keys)
+            all_nodes.extend(nodes)
+        return all_nodes
+
     @model_serializer
     def ser_model(self):
         set = {
@@ -94,6 +161,9 @@ class UnstructedNodeParser(BaseComponent, UnstructuredReader):
     Args:
         chunk_size (int): Size of each chunk for processing. Default is 250.
         chunk_overlap (int): Overlap size between chunks. Default is 0.
+        strategy (str): Partition strategy, one of hi_res, fast, ocr_only or auto.
+            auto probes each PDF and picks the cheapest strategy that keeps its
+            content. Default is hi_res.
         **kwargs: Additional keyword arguments.
 
     Methods:
@@ -104,11 +174,19 @@ class UnstructedNodeParser(BaseComponent, UnstructuredReader):
             Serializes the model and returns a dictionary with its attributes.
     """
 
-    def __init__(self, chunk_size: int = 250, chunk_overlap: int = 0, **kwargs):
+    STRATEGIES: ClassVar[tuple] = ("hi_res", "fast", "ocr_only", "auto")
+    # Pages probed in auto mode and minimum characters for a page to count as having text
+    PROBE_PAGES: ClassVar[int] = int(os.getenv("PARSER_PROBE_PAGES", 5))
+    PROBE_MIN_CHARS: ClassVar[int] = 20
+
+    def __init__(self, chunk_size: int = 250, chunk_overlap: int = 0, strategy: str = "hi_res", **kwargs):
         super().__init__(**kwargs)
         UnstructuredReader.__init__(self, excluded_metadata_keys=["fake"], **kwargs)
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unsupported strategy {strategy}, expected one of {self.STRATEGIES}")
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.strategy = strategy
         self.comp_type = CompType.NODEPARSER
         self.comp_subtype = NodeParserType.UNSTRUCTURED
         # excluded metadata
@@ -118,8 +196,11 @@ class UnstructedNodeParser(BaseComponent, UnstructuredReader):
             "last_modified_date",
             "last_accessed_date",
             "orig_elements",
+            "image_paths",
+            "parse_strategy",
+            "parse_time",
         ]
-        self._excluded_llm_metadata_keys = ["orig_elements"]
+        self._excluded_llm_metadata_keys = ["orig_elements", "image_paths", "parse_strategy", "parse_time"]
         # PDF image extraction parameters
         self._extract_images_in_pdf = True
         self._image_output_dir = IMG_OUTPUT_DIR
@@ -131,34 +212,99 @@ class UnstructedNodeParser(BaseComponent, UnstructuredReader):
                 register_picture_partitioner(DocxParagraphPicturePartitioner)
                 nodelist = []
                 processed_paths = set()
-                for document in v:
-                    if "file_path" in document.metadata and document.metadata["file_path"] not in processed_paths:
-                        file_path = document.metadata["file_path"]
-                        nodes = self.load_data(
-                            file=file_path,
-                            unstructured_kwargs={
-                                "strategy": "hi_res",
-                                "extract_images_in_pdf": self._extract_images_in_pdf,
-                                "extract_image_block_types": ["Image"],
-                                "extract_image_block_output_dir": self._image_output_dir,
-                                "languages": self._image_language,
-                                "chunking_strategy": "basic",
-                                "overlap_all": True,
-                                "max_characters": self.chunk_size,
-                                "overlap": self.chunk_overlap,
-                            },
-                            split_documents=True,
-                            document_kwargs={
-                                "excluded_embed_metadata_keys": self._excluded_embed_metadata_keys,
-                                "excluded_llm_metadata_keys": self._excluded_llm_metadata_keys,
-                            },
-                        )
-                        nodelist += nodes
-                        processed_paths.add(file_path)
+                # Images referenced by the nodes are saved by the time the parse returns
+                with image_saves():
+                    for document in v:
+                        if "file_path" in document.metadata and document.metadata["file_path"] not in processed_paths:
+                            file_path = document.metadata["file_path"]
+                            strategy = self.select_strategy(file_path)
+                            start = time.perf_counter()
+                            nodes = self.load_data(
+                                file=file_path,
+                                unstructured_kwargs={
+                                    "strategy": strategy,
+                                    "extract_images_in_pdf": self._extract_images_in_pdf,
+                                    "extract_image_block_types": ["Image"],
+                                    "extract_image_block_output_dir": self._image_output_dir,
+                                    "languages": self._image_language,
+                                    "chunking_strategy": "basic",
+                                    "overlap_all": True,
+                                    "max_characters": self.chunk_size,
+                                    "overlap": self.chunk_overlap,
+                                },
+                                split_documents=True,
+                                document_kwargs={
+                                    "excluded_embed_metadata_keys": self._excluded_embed_metadata_keys,
+                                    "excluded_llm_metadata_keys": self._excluded_llm_metadata_keys,
+                                },
+                            )
+                            parse_time = round(time.perf_counter() - start, 3)
+                            for node in nodes:
+                                node.metadata["parse_strategy"] = strategy
+                                node.metadata["parse_time"] = parse_time
+                                # Decoded once here instead of on every citation of the node
+                                image_paths = self.get_image_paths(node)
+                                if image_paths:
+                                    node.metadata["image_paths"] = image_paths
+                            nodelist += nodes
+                            processed_paths.add(file_path)
                 return nodelist
 
         return None
 
+    @staticmethod
+    def get_image_paths(node) -> List[str]:
+        """Get the paths of the images of a node from its original elements
+        :param node: node parsed by unstructured
+        :return: image paths in document order."""
+        if "orig_elements" not in node.metadata:
+            return []
+        elements = elements_from_base64_gzipped_json(node.metadata["orig_elements"])
+        return [element.metadata.image_path for element in elements if element.metadata.image_path]
+
+    def select_strategy(self, file_path) -> str:
+        """Pick the partition strategy for a file
+        :param file_path: path of the file to parse
+        :return: strategy passed to unstructured."""
+        if self.strategy != "auto":
+            return self.strategy
+        if not file_path.lower().endswith(".pdf"):
+            # Only PDFs and images go through layout detection, images need it
+            return "hi_res"
+        try:
+            text_pages, pages, has_images = self._probe_pdf(file_path)
+        except Exception as e:
+            print(f"Failed to probe {file_path}: {e}")
+            return "hi_res"
+        if text_pages == 0:
+            # Scanned document without text layer
+            return "ocr_only"
+        if text_pages == pages and not has_images:
+            # Born-digital text only document
+            return "fast"
+        return "hi_res"
+
+    def _probe_pdf(self, file_path):
+        # Count probed pages, pages with a text layer and look for embedded images
+        pages = 0
+        text_pages = 0
+        has_images = False
+        for page in extract_pages(file_path, maxpages=self.PROBE_PAGES):
+            pages += 1
+            chars = 0
+            stack = list(page)
+            while stack:
+                element = stack.pop()
+                if isinstance(element, LTTextContainer):
+                    chars += len(element.get_text().strip())
+                elif isinstance(element, LTImage):
+                    has_images = True
+                elif isinstance(element, LTFigure):
+                    stack.extend(element)
+            if chars >= self.PROBE_MIN_CHARS:
+                text_pages += 1
+        return text_pages, pages, has_images
+
     @model_serializer
     def ser_model(self):
         set = {
@@ -166,5 +312,6 @@ class UnstructedNodeParser(BaseComponent, UnstructuredReader):
             "parser_type": self.comp_subtype,
             "chunk_size": self.chunk_size,
             "chunk_overlap": self.chunk_overlap,
+            "strategy": self.strategy,
         }
         return set
@@ -1,12 +1,16 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
 import os
+import threading
 import time
+from collections import OrderedDict
 from typing import Any, Callable, List, Optional
 
 from comps.cores.proto.api_protocol import ChatCompletionRequest
 from edgecraftrag.base import BaseComponent, CallbackType, CompType, InferenceType
+from edgecraftrag.components.generator import LLM_RES_PREFIX
 from edgecraftrag.components.postprocessor import RerankProcessor
 from fastapi.responses import StreamingResponse
 from llama_index.core.schema import Document, QueryBundle
@@ -17,6 +21,69 @@ class PipelineStatus(BaseModel):
     active: bool = False
 
 
+class RetrievalCache:
+    """LRU cache with TTL for retrieval results.
+
+    Keys contain the index version, so entries of an outdated index are never hit and age out.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float = 600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_enabled(self):
+        return self.max_size > 0
+
+    def make_key(self, pl, chat_request: ChatCompletionRequest):
+        query = " ".join(str(chat_request.messages).split())
+        retriever = pl.retriever
+        topk = getattr(retriever, "similarity_top_k", getattr(retriever, "topk", None))
+        processors = (
+            tuple((p.idx, effective_top_n(p, chat_request)) for p in pl.postprocessor) if pl.postprocessor else ()
+        )
+        index_version = getattr(pl.indexer, "version", None)
+        return (query, retriever.idx, topk, processors, index_version)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._cache[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._cache[key] = (time.monotonic(), value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else None,
+            "size": len(self._cache),
+        }
+
+
+class InflightCounter:
+    # Requests running on any version of a pipeline, shared by its versions
+    def __init__(self):
+        self.value = 0
+
+
 class Pipeline(BaseComponent):
 
     node_parser: Optional[BaseComponent] = Field(default=None)
@@ -25,7 +92,9 @@ class Pipeline(BaseComponent):
     postprocessor: Optional[List[BaseComponent]] = Field(default=None)
     generator: Optional[BaseComponent] = Field(default=None)
     benchmark: Optional[BaseComponent] = Field(default=None)
+    retrieval_cache: Optional[RetrievalCache] = Field(default=None)
     status: PipelineStatus = Field(default=PipelineStatus())
+    max_concurrency: int = Field(default=0)
     run_pipeline_cb: Optional[Callable[..., Any]] = Field(default=None)
     run_retriever_cb: Optional[Callable[..., Any]] = Field(default=None)
     run_data_prepare_cb: Optional[Callable[..., Any]] = Field(default=None)
@@ -44,6 +113,71 @@ class Pipeline(BaseComponent):
         self.run_data_prepare_cb = run_simple_doc
         self.run_data_update_cb = run_update_doc
         self._node_changed = True
+        # 0 means unlimited concurrent requests
+        self._semaphore = None
+        self.set_max_concurrency(int(os.getenv("PIPELINE_MAX_CONCURRENCY", 0)))
+        self._inflight = InflightCounter()
+        self.retrieval_cache = RetrievalCache(
+            max_size=int(os.getenv("RETRIEVAL_CACHE_SIZE", 256)), ttl=float(os.getenv("RETRIEVAL_CACHE_TTL", 600))
+        )
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight.value
+
+    def set_max_concurrency(self, max_concurrency: int):
+        # Requests holding a slot of the previous semaphore release it on that one
+        if max_concurrency == self.max_concurrency and self._semaphore is not None:
+            return
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+
+    async def acquire(self) -> Callable[[], None]:
+        """Wait for a free request slot of this pipeline
+        :return: callback to release the slot, should be called exactly once."""
+        semaphore = self._semaphore
+        if semaphore is not None:
+            await semaphore.acquire()
+        inflight = self._inflight
+        inflight.value += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            inflight.value -= 1
+            if semaphore is not None:
+                semaphore.release()
+
+        return release
+
+    def copy_for_update(self) -> "Pipeline":
+        # New version of this pipeline sharing the current components, the
+        # components to be updated are replaced on the copy only
+        pl = Pipeline(self.name)
+        pl.idx = self.idx
+        pl.update(self.node_parser, self.indexer, self.retriever, self.postprocessor, self.generator)
+        pl.benchmark = self.benchmark
+        pl.retrieval_cache = self.retrieval_cache
+        pl.status = PipelineStatus(active=self.status.active)
+        # All versions of the pipeline share its request slots, requests still
+        # running on the old version count against the limit of the new one
+        pl.max_concurrency = self.max_concurrency
+        pl._semaphore = self._semaphore
+        # Removal checks the requests still streaming from older versions too
+        pl._inflight = self._inflight
+        return pl
+
+    def warm_up(self):
+        # Run a first retrieval so that lazy initialization is not paid by users
+        if self.retriever is None:
+            return
+        try:
+            self.retriever.run(query="warm up")
+        except Exception as e:
+            print(f"Pipeline {self.name} warm up failed: {e}")
 
     # TODO: consider race condition
     @property
@@ -104,6 +238,7 @@ class Pipeline(BaseComponent):
             "postprocessor": self.postprocessor,
             "generator": self.generator,
             "status": self.status,
+            "max_concurrency": self.max_concurrency,
         }
         return set
 
@@ -127,19 +262,40 @@ class Pipeline(BaseComponent):
         return False
 
 
+def effective_top_n(processor, chat_request: ChatCompletionRequest) -> Optional[int]:
+    # Nodes kept by a reranker for a request, the request top_n overrides the configured one if set
+    if not isinstance(processor, RerankProcessor):
+        return None
+    if chat_request.top_n != ChatCompletionRequest.model_fields["top_n"].default:
+        return chat_request.top_n
+    return processor.top_n
+
+
+def run_postprocessor(processor, retri_res, query_bundle, chat_request: ChatCompletionRequest):
+    if isinstance(processor, RerankProcessor):
+        # Per request, the configured top_n of the shared processor is left untouched
+        return processor.run(
+            retri_res=retri_res, query_bundle=query_bundle, top_n=effective_top_n(processor, chat_request)
+        )
+    return processor.run(retri_res=retri_res, query_bundle=query_bundle)
+
+
 # Test callback to retrieve nodes from query
 def run_test_retrieve(pl: Pipeline, chat_request: ChatCompletionRequest) -> Any:
+    cache_key = None
+    if pl.retrieval_cache.is_enabled():
+        cache_key = pl.retrieval_cache.make_key(pl, chat_request)
+        retri_res = pl.retrieval_cache.get(cache_key)
+        if retri_res is not None:
+            return retri_res
     query = chat_request.messages
     retri_res = pl.retriever.run(query=query)
     query_bundle = QueryBundle(query)
     if pl.postprocessor:
         for processor in pl.postprocessor:
-            if (
-                isinstance(processor, RerankProcessor)
-                and chat_request.top_n != ChatCompletionRequest.model_fields["top_n"].default
-            ):
-                processor.top_n = chat_request.top_n
-            retri_res = processor.run(retri_res=retri_res, query_bundle=query_bundle)
+            retri_res = run_postprocessor(processor, retri_res, query_bundle, chat_request)
+    if cache_key is not None:
+        pl.retrieval_cache.put(cache_key, retri_res)
     return retri_res
 
 
@@ -152,14 +308,15 @@ def run_simple_doc(pl: Pipeline, docs: List[Document]) -> Any:
 
 
 def run_update_doc(pl: Pipeline, docs: List[Document]) -> Any:
+    # Rebuild the index of a new version of a pipeline, see PipelineMgr.run_data_update,
+    # requests keep being served by the old indexer and retriever until the swap
     n = pl.node_parser.run(docs=docs)
     if pl.indexer is not None:
-        pl.indexer.reinitialize_indexer()
-        pl.retriever._vector_store = pl.indexer.vector_store
-        pl.retriever._docstore = pl.indexer.docstore
-
-        pl.indexer.insert_nodes(n)
-    print(pl.indexer._index_struct)
+        indexer = pl.indexer.clone()
+        indexer.insert_nodes(n)
+        pl.indexer = indexer
+        if pl.retriever is not None:
+            pl.retriever = pl.retriever.clone(indexer)
     return n
 
 
@@ -168,9 +325,19 @@ def benchmark_response(ret, benchmark, benchmark_index, start):
         original_body_iterator = ret.body_iterator
 
         async def timing_wrapper():
+            token_times = []
+            response_bytes = 0
             async for chunk in original_body_iterator:
+                # Only llm deltas count as tokens, retrieved nodes are streamed afterwards
+                if isinstance(chunk, str) and chunk.startswith(LLM_RES_PREFIX):
+                    token_times.append(time.perf_counter())
+                response_bytes += len(chunk.encode() if isinstance(chunk, str) else chunk)
                 yield chunk
-            benchmark.update_benchmark_data(benchmark_index, CompType.GENERATOR, start, time.perf_counter())
+            end = time.perf_counter()
+            benchmark.update_benchmark_data(benchmark_index, CompType.GENERATOR, start, end)
+            benchmark.insert_token_data(benchmark_index, start, token_times)
+            citation_time = end - token_times[-1] if token_times else None
+            benchmark.update_response_data(benchmark_index, response_bytes, citation_time)
             benchmark.insert_llm_data(benchmark_index)
 
         ret.body_iterator = timing_wrapper()
@@ -181,22 +348,27 @@ def benchmark_response(ret, benchmark, benchmark_index, start):
 
 def run_test_generator_ben(pl: Pipeline, chat_request: ChatCompletionRequest) -> Any:
     benchmark_index = pl.benchmark.init_benchmark_data()
-    start = time.perf_counter()
-    query = chat_request.messages
-    retri_res = pl.retriever.run(query=query)
-    query_bundle = QueryBundle(query)
-    pl.benchmark.update_benchmark_data(benchmark_index, CompType.RETRIEVER, start, time.perf_counter())
-
-    start = time.perf_counter()
-    if pl.postprocessor:
-        for processor in pl.postprocessor:
-            if (
-                isinstance(processor, RerankProcessor)
-                and chat_request.top_n != ChatCompletionRequest.model_fields["top_n"].default
-            ):
-                processor.top_n = chat_request.top_n
-            retri_res = processor.run(retri_res=retri_res, query_bundle=query_bundle)
-    pl.benchmark.update_benchmark_data(benchmark_index, CompType.POSTPROCESSOR, start, time.perf_counter())
+    cache_key = None
+    retri_res = None
+    if pl.retrieval_cache.is_enabled():
+        cache_key = pl.retrieval_cache.make_key(pl, chat_request)
+        retri_res = pl.retrieval_cache.get(cache_key)
+    pl.benchmark.update_cache_hit(benchmark_index, retri_res is not None)
+
+    if retri_res is None:
+        start = time.perf_counter()
+        query = chat_request.messages
+        retri_res = pl.retriever.run(query=query)
+        query_bundle = QueryBundle(query)
+        pl.benchmark.update_benchmark_data(benchmark_index, CompType.RETRIEVER, start, time.perf_counter())
+
+        start = time.perf_counter()
+        if pl.postprocessor:
+            for processor in pl.postprocessor:
+                retri_res = run_postprocessor(processor, retri_res, query_bundle, chat_request)
+        pl.benchmark.update_benchmark_data(benchmark_index, CompType.POSTPROCESSOR, start, time.perf_counter())
+        if cache_key is not None:
+            pl.retrieval_cache.put(cache_key, retri_res)
 
     start = time.perf_counter()
     if pl.generator is None:
@@ -218,18 +390,7 @@ def run_test_generator_ben(pl: Pipeline, chat_request: ChatCompletionRequest) ->
 
 
 def run_test_generator(pl: Pipeline, chat_request: ChatCompletionRequest) -> Any:
-    query = chat_request.messages
-    retri_res = pl.retriever.run(query=query)
-    query_bundle = QueryBundle(query)
-
-    if pl.postprocessor:
-        for processor in pl.postprocessor:
-            if (
-                isinstance(processor, RerankProcessor)
-                and chat_request.top_n != ChatCompletionRequest.model_fields["top_n"].default
-            ):
-                processor.top_n = chat_request.top_n
-            retri_res = processor.run(retri_res=retri_res, query_bundle=query_bundle)
+    retri_res = run_test_retrieve(pl, chat_request)
 
     if pl.generator is None:
         ret = "No Generator Specified"
@@ -1,10 +1,12 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import Any
+from typing import Any, List, Optional
 
 from edgecraftrag.base import BaseComponent, CompType, PostProcessorType
+from edgecraftrag.components.node_parser import WINDOW_DOC_KEY, WINDOW_END_KEY, WINDOW_START_KEY, sentence_store
 from llama_index.core.postprocessor import MetadataReplacementPostProcessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
 from pydantic import model_serializer
 
 
@@ -20,7 +22,8 @@ class RerankProcessor(BaseComponent):
         self.top_n = top_n
 
     def run(self, **kwargs) -> Any:
-        self.model.top_n = self.top_n
+        top_n = kwargs.get("top_n")
+        self.model.top_n = top_n if top_n is not None else self.top_n
         query_bundle = None
         query_str = None
         if "retri_res" in kwargs:
@@ -58,6 +61,20 @@ class MetadataReplaceProcessor(BaseComponent, MetadataReplacementPostProcessor):
             query_str = kwargs["query_str"]
         return self.postprocess_nodes(nodes, query_bundle=query_bundle, query_str=query_str)
 
+    def _postprocess_nodes(
+        self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None
+    ) -> List[NodeWithScore]:
+        for n in nodes:
+            metadata = n.node.metadata
+            content = metadata.get(self.target_metadata_key)
+            if content is None and WINDOW_DOC_KEY in metadata:
+                content = sentence_store.get_window(
+                    metadata[WINDOW_DOC_KEY], metadata[WINDOW_START_KEY], metadata[WINDOW_END_KEY]
+                )
+            if content is not None:
+                n.node.set_content(content)
+        return nodes
+
     @model_serializer
     def ser_model(self):
         set = {"idx": self.idx, "postprocessor_type": self.comp_subtype, "model": None, "top_n": None}
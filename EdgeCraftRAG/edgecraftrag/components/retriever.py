@@ -34,6 +34,11 @@ class VectorSimRetriever(BaseComponent, VectorIndexRetriever):
         # retrieved are freezed to the time of the retriever's creation.
         self._node_ids = None
 
+    def clone(self, indexer):
+        retriever = VectorSimRetriever(indexer, similarity_top_k=self.similarity_top_k)
+        retriever.idx = self.idx
+        return retriever
+
     def run(self, **kwargs) -> Any:
         for k, v in kwargs.items():
             if k == "query":
@@ -70,6 +75,11 @@ class AutoMergeRetriever(BaseComponent, AutoMergingRetriever):
             callback_manager=indexer._callback_manager,
         )
 
+    def clone(self, indexer):
+        retriever = AutoMergeRetriever(indexer, similarity_top_k=self.topk)
+        retriever.idx = self.idx
+        return retriever
+
     def run(self, **kwargs) -> Any:
         for k, v in kwargs.items():
             if k == "query":
@@ -94,6 +104,11 @@ class SimpleBM25Retriever(BaseComponent):
         self._docstore = indexer._docstore
         self.topk = kwargs["similarity_top_k"]
 
+    def clone(self, indexer):
+        retriever = SimpleBM25Retriever(indexer, similarity_top_k=self.topk)
+        retriever.idx = self.idx
+        return retriever
+
     def run(self, **kwargs) -> Any:
         for k, v in kwargs.items():
             if k == "query":
@@ -7,6 +7,7 @@ from typing import Any, Callable, List, Optional
 
 from edgecraftrag.base import BaseMgr
 from edgecraftrag.components.data import File
+from edgecraftrag.components.node_parser import sentence_store
 from llama_index.core.schema import Document
 
 
@@ -47,17 +48,14 @@ class FilelMgr(BaseMgr):
         return input_docs
 
     def get_file_by_name_or_id(self, name: str):
-        for _, file in self.components.items():
-            if file.name == name or file.idx == name:
-                return file
-        return None
+        return self.get_by_name_or_id(name)
 
     def get_files(self):
-        return [file for _, file in self.components.items()]
+        return list(self.components.values())
 
     def get_all_docs(self) -> List[Document]:
         all_docs = []
-        for _, file in self.components.items():
+        for file in self.components.values():
             all_docs.extend(file.documents)
         return all_docs
 
@@ -66,6 +64,7 @@ class FilelMgr(BaseMgr):
         return file.documents if file else []
 
     def del_file(self, name):
+        # Sentences of the file are kept until the re-indexed pipeline is live, see release_docs
         file = self.get_file_by_name_or_id(name)
         if file:
             self.remove(file.idx)
@@ -73,6 +72,11 @@ class FilelMgr(BaseMgr):
         else:
             return False
 
+    def release_docs(self, docs: List[Document]):
+        # Drop the sentence windows of deleted documents once no live index refers to them
+        for doc in docs:
+            sentence_store.remove(doc.doc_id)
+
     def update_file(self, name):
         file = self.get_file_by_name_or_id(name)
         if file:
@@ -2,6 +2,10 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 
 from edgecraftrag.api_schema import ModelIn
 from edgecraftrag.base import BaseComponent, BaseMgr, CompType, ModelType
@@ -17,41 +21,116 @@ class ModelMgr(BaseMgr):
 
     def __init__(self):
         self._lock = asyncio.Lock()
+        # Memory budget of resident models in bytes, 0 means unlimited
+        self._memory_budget = int(float(os.getenv("MODEL_MEMORY_BUDGET_GB", 0)) * 1024**3)
+        self._last_used = {}
         super().__init__()
 
-    def get_model_by_name(self, name: str):
+    def get_name(self, comp: BaseComponent) -> str:
+        # Models are looked up by model_id
+        return getattr(comp, "model_id", comp.name)
+
+    def add(self, comp: BaseComponent):
+        super().add(comp)
+        self.touch(comp)
+
+    def remove(self, idx):
+        self._last_used.pop(idx, None)
+        super().remove(idx)
+
+    def touch(self, model: BaseComponent):
+        self._last_used[model.idx] = time.monotonic()
+
+    def get_resident_size(self) -> int:
+        return sum(v.resident_size() for _, v in self.components.items())
+
+    def enforce_memory_budget(self, pipelines: list) -> list:
+        """Unload least recently used models until the models fit in the memory budget
+        :param pipelines: active pipelines, models referenced by them are never unloaded
+        :return: model_ids of unloaded models."""
+        unloaded = []
+        if self._memory_budget <= 0:
+            return unloaded
+        candidates = []
+        # Models of active pipelines are compiled lazily, count them as resident
+        expected = 0
         for _, v in self.components.items():
-            if v.model_id == name:
-                model_type = v.comp_subtype.value
-                model_info = {
-                    "model_type": model_type,
-                    "model_id": getattr(v, "model_id", "Unknown"),
-                }
-                if model_type == ModelType.LLM:
-                    model_info["model_path"] = getattr(v, "model_name", "Unknown")
-                    model_info["device"] = getattr(v, "device_map", "Unknown")
-                else:
-                    model_info["model_path"] = getattr(v, "model_id_or_path", "Unknown")
-                    model_info["device"] = getattr(v, "device", getattr(v, "_device", "Unknown"))
-                return model_info
-        return None
+            if any(pl.model_existed(v.model_id) for pl in pipelines):
+                self.touch(v)
+                expected += v.size
+            elif v.is_loaded():
+                candidates.append(v)
+                expected += v.resident_size()
+        candidates.sort(key=lambda v: self._last_used.get(v.idx, 0))
+        for v in candidates:
+            if expected <= self._memory_budget:
+                break
+            expected -= v.resident_size()
+            v.unload()
+            unloaded.append(v.model_id)
+        return unloaded
+
+    def warm_up(self, model_paras: List[ModelIn]) -> dict:
+        """Load and compile models in parallel, reusing models already loaded
+        :param model_paras: models to warm up
+        :return: compile statistics by model_id, models that failed are logged and skipped."""
+
+        def warm_up_model(model_para):
+            try:
+                model = self.search_model(model_para)
+                if model is None:
+                    model = self.load_model(model_para)
+                model.compile_model()
+                return model
+            except Exception as e:
+                print(f"Failed to warm up model {model_para.model_id}: {e}")
+                return None
+
+        workers = max(1, min(len(model_paras), int(os.getenv("MODEL_WARMUP_WORKERS", 4))))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            models = list(executor.map(warm_up_model, model_paras))
+        stats = {}
+        for model in models:
+            if model is None:
+                continue
+            if self.get(model.idx) is None:
+                self.add(model)
+            stats[model.model_id] = {
+                "load_time": model.load_time,
+                "compile_time": model.compile_time,
+                "compile_cache_hit": model.compile_cache_hit,
+            }
+        return stats
+
+    @staticmethod
+    def get_model_info(v):
+        model_type = v.comp_subtype.value
+        model_info = {
+            "model_type": model_type,
+            "model_id": getattr(v, "model_id", "Unknown"),
+        }
+        if model_type == ModelType.LLM:
+            model_info["model_path"] = getattr(v, "model_name", "Unknown")
+            model_info["device"] = getattr(v, "device_map", "Unknown")
+        else:
+            model_info["model_path"] = getattr(v, "model_id_or_path", "Unknown")
+            model_info["device"] = getattr(v, "device", getattr(v, "_device", "Unknown"))
+        model_info["loaded"] = v.is_loaded()
+        model_info["load_time"] = v.load_time
+        model_info["compile_time"] = v.compile_time
+        model_info["compile_cache_hit"] = v.compile_cache_hit
+        model_info["resident_size"] = v.resident_size()
+        return model_info
+
+    def get_model_by_name(self, name: str):
+        v = self.get_by_name(name)
+        return self.get_model_info(v) if v is not None else None
 
     def get_models(self):
         model = {}
         for k, v in self.components.items():
             # Supplement the information of the model
-            model_type = v.comp_subtype.value
-            model_info = {
-                "model_type": model_type,
-                "model_id": getattr(v, "model_id", "Unknown"),
-            }
-            if model_type == ModelType.LLM:
-                model_info["model_path"] = getattr(v, "model_name", "Unknown")
-                model_info["device"] = getattr(v, "device_map", "Unknown")
-            else:
-                model_info["model_path"] = getattr(v, "model_id_or_path", "Unknown")
-                model_info["device"] = getattr(v, "device", getattr(v, "_device", "Unknown"))
-            model[k] = model_info
+            model[k] = self.get_model_info(v)
         return model
 
     def search_model(self, modelin: ModelIn) -> BaseComponent:
@@ -68,14 +147,15 @@ class ModelMgr(BaseMgr):
         return None
 
     def del_model_by_name(self, name: str):
-        for key, v in self.components.items():
-            if v and v.model_id == name:
-                self.remove(key)
-                return "Model deleted"
+        v = self.get_by_name(name)
+        if v is not None:
+            self.remove(v.idx)
+            return "Model deleted"
         return "Model not found"
 
     @staticmethod
     def load_model(model_para: ModelIn):
+        start = time.perf_counter()
         model = None
         match model_para.model_type:
             case ModelType.EMBEDDING:
@@ -104,4 +184,6 @@ class ModelMgr(BaseMgr):
                 model.comp_type = CompType.MODEL
                 model.comp_subtype = ModelType.VLLM
                 model.model_id_or_path = model_para.model_id
+        if model is not None:
+            model.load_time = time.perf_counter() - start
         return model
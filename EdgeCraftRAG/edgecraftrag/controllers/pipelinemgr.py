@@ -2,20 +2,26 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import asyncio
-import gc
-from typing import Any, List
+import os
+from typing import Any, List, Optional
 
 from comps.cores.proto.api_protocol import ChatCompletionRequest
-from edgecraftrag.base import BaseMgr, CallbackType
+from edgecraftrag.base import BaseMgr, CallbackType, collect_garbage_later
 from edgecraftrag.components.pipeline import Pipeline
 from edgecraftrag.controllers.nodemgr import NodeMgr
+from fastapi.responses import StreamingResponse
 from llama_index.core.schema import Document
 
 
 class PipelineMgr(BaseMgr):
 
     def __init__(self):
+        # Default pipeline, serves requests that do not specify a pipeline
         self._active_pipeline = None
+        # Active pipelines in activation order. The list is never mutated in place
+        # but replaced as a whole, so readers always see a consistent snapshot
+        self._active_pipelines = []
+        self._max_active = max(1, int(os.getenv("MAX_ACTIVE_PIPELINES", 1)))
         self._lock = asyncio.Lock()
         super().__init__()
 
@@ -25,10 +31,7 @@ class PipelineMgr(BaseMgr):
         return pl
 
     def get_pipeline_by_name_or_id(self, name: str):
-        for _, pl in self.components.items():
-            if pl.name == name or pl.idx == name:
-                return pl
-        return None
+        return self.get_by_name_or_id(name)
 
     def remove_pipeline_by_name_or_id(self, name: str):
         pl = self.get_pipeline_by_name_or_id(name)
@@ -36,6 +39,8 @@ class PipelineMgr(BaseMgr):
             return "Pipeline not found..."
         if pl.status.active:
             return "Unable to remove an active pipeline..."
+        if pl.inflight > 0:
+            return "Unable to remove a pipeline with in-flight requests..."
         pl.node_parser = None
         pl.indexer = None
         pl.retriever = None
@@ -50,11 +55,11 @@ class PipelineMgr(BaseMgr):
         pl._node_changed = None
         self.remove(pl.idx)
         del pl
-        gc.collect()
+        collect_garbage_later()
         return "Pipeline removed successfully"
 
     def get_pipelines(self):
-        return [pl for _, pl in self.components.items()]
+        return list(self.components.values())
 
     def activate_pipeline(self, name: str, active: bool, nm: NodeMgr):
         pl = self.get_pipeline_by_name_or_id(name)
@@ -62,48 +67,111 @@ class PipelineMgr(BaseMgr):
         if pl is not None:
             if not active:
                 pl.status.active = False
-                self._active_pipeline = None
+                self._active_pipelines = [p for p in self._active_pipelines if p is not pl]
+                if self._active_pipeline is pl:
+                    self._active_pipeline = self._active_pipelines[-1] if self._active_pipelines else None
                 return
             if pl.node_changed:
                 nodelist = nm.get_nodes(pl.node_parser.idx)
+        # Get the pipeline ready before it becomes visible to requests
         pl.check_active(nodelist)
-        prevactive = self._active_pipeline
-        if prevactive:
+        active_pipelines = [p for p in self._active_pipelines if p is not pl] + [pl]
+        # Deactivate the least recently activated pipelines beyond the limit,
+        # requests already running on them will finish on them
+        for prevactive in active_pipelines[: -self._max_active]:
             prevactive.status.active = False
         pl.status.active = True
+        self._active_pipelines = active_pipelines[-self._max_active :]
         self._active_pipeline = pl
 
-    def get_active_pipeline(self) -> Pipeline:
-        return self._active_pipeline
+    def swap_pipeline(self, old: Pipeline, new: Pipeline):
+        # Atomically replace a pipeline by its new version, requests already
+        # running keep their reference to the old one and finish on it
+        self.add(new)
+        self._active_pipelines = [new if p is old else p for p in self._active_pipelines]
+        if self._active_pipeline is old:
+            self._active_pipeline = new
+        old.status.active = False
+
+    def get_active_pipeline(self, name: Optional[str] = None) -> Pipeline:
+        if name is None:
+            return self._active_pipeline
+        for pl in self._active_pipelines:
+            if pl.name == name or pl.idx == name:
+                return pl
+        return None
+
+    def get_active_pipelines(self) -> List[Pipeline]:
+        return list(self._active_pipelines)
 
     def notify_node_change(self):
-        for _, pl in self.components.items():
+        for pl in self.components.values():
             pl.set_node_change()
 
-    def run_pipeline(self, chat_request: ChatCompletionRequest) -> Any:
-        ap = self.get_active_pipeline()
+    async def run_pipeline(self, chat_request: ChatCompletionRequest, name: Optional[str] = None) -> Any:
+        ap = self.get_active_pipeline(name)
         out = None
         if ap is not None:
-            out = ap.run(cbtype=CallbackType.PIPELINE, chat_request=chat_request)
+            release = await ap.acquire()
+            try:
+                out = ap.run(cbtype=CallbackType.PIPELINE, chat_request=chat_request)
+            except BaseException:
+                release()
+                raise
+            ret = out[0] if isinstance(out, tuple) else out
+            if isinstance(ret, StreamingResponse):
+                # Keep the concurrency slot until the whole response is streamed
+                ret.body_iterator = release_after_stream(ret.body_iterator, release)
+            else:
+                release()
             return out
         return -1
 
-    def run_retrieve(self, chat_request: ChatCompletionRequest) -> Any:
-        ap = self.get_active_pipeline()
+    async def run_retrieve(self, chat_request: ChatCompletionRequest, name: Optional[str] = None) -> Any:
+        ap = self.get_active_pipeline(name)
         out = None
         if ap is not None:
-            out = ap.run(cbtype=CallbackType.RETRIEVE, chat_request=chat_request)
+            release = await ap.acquire()
+            try:
+                out = ap.run(cbtype=CallbackType.RETRIEVE, chat_request=chat_request)
+            finally:
+                release()
             return out
         return -1
 
-    def run_data_prepare(self, docs: List[Document]) -> Any:
-        ap = self.get_active_pipeline()
+    def run_data_prepare(self, docs: List[Document], name: Optional[str] = None) -> Any:
+        ap = self.get_active_pipeline(name)
         if ap is not None:
             return ap.run(cbtype=CallbackType.DATAPREP, docs=docs)
         return -1
 
-    def run_data_update(self, docs: List[Document]) -> Any:
-        ap = self.get_active_pipeline()
-        if ap is not None:
-            return ap.run(cbtype=CallbackType.DATAUPDATE, docs=docs)
-        return -1
+    def run_data_update(self, docs: List[Document], name: Optional[str] = None) -> Any:
+        ap = self.get_active_pipeline(name)
+        if ap is None:
+            return -1
+        # Copy-on-write: re-index into a new version of the pipeline, then swap
+        # every pipeline sharing the old indexer to the rebuilt one
+        new_ap = ap.copy_for_update()
+        nodelist = new_ap.run(cbtype=CallbackType.DATAUPDATE, docs=docs)
+        if nodelist is None:
+            return None
+        indexer = ap.indexer
+        if indexer is not None and new_ap.indexer is not indexer:
+            for pl in self.get_pipelines():
+                if pl is ap or pl.indexer is not indexer:
+                    continue
+                new_pl = pl.copy_for_update()
+                new_pl.indexer = new_ap.indexer
+                if pl.retriever is not None:
+                    new_pl.retriever = pl.retriever.clone(new_ap.indexer)
+                self.swap_pipeline(pl, new_pl)
+        self.swap_pipeline(ap, new_ap)
+        return nodelist
+
+
+async def release_after_stream(body_iterator, release):
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        release()
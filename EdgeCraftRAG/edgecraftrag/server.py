@@ -1,6 +1,8 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
+import json
 import os
 
 import uvicorn
@@ -8,6 +10,8 @@ from edgecraftrag.api.v1.chatqna import chatqna_app
 from edgecraftrag.api.v1.data import data_app
 from edgecraftrag.api.v1.model import model_app
 from edgecraftrag.api.v1.pipeline import pipeline_app
+from edgecraftrag.api_schema import ModelIn
+from edgecraftrag.context import ctx
 from fastapi import FastAPI
 from llama_index.core.settings import Settings
 
@@ -19,6 +23,33 @@ for sub_app in sub_apps:
         app.router.routes.append(route)
 
 
+# Pre-compile configured models so that the first pipeline activation
+# and the first query do not pay the compile latency
+@app.on_event("startup")
+async def warm_up_models():
+    config = os.getenv("MODEL_WARMUP_CONFIG")
+    if not config or not os.path.exists(config):
+        return
+    try:
+        with open(config) as f:
+            models = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Failed to read model warm-up config {config}: {e}")
+        return
+    if not isinstance(models, list):
+        print(f"Model warm-up config {config} is not a list of models")
+        return
+    model_paras = []
+    for m in models:
+        try:
+            model_paras.append(ModelIn(**m))
+        except (TypeError, ValueError) as e:
+            print(f"Skipping invalid model in {config}: {e}")
+    if model_paras:
+        stats = await asyncio.to_thread(ctx.get_model_mgr().warm_up, model_paras)
+        print(f"Models warmed up: {stats}")
+
+
 if __name__ == "__main__":
     Settings.llm = None
 
@@ -1,8 +1,13 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import contextvars
+import functools
 import io
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from typing import Iterator
 
 from docx.text.paragraph import Paragraph
@@ -14,6 +19,81 @@ GRADIO_TEMP_DIR = os.getenv("GRADIO_TEMP_DIR", "/home/user/gradio_cache")
 IMG_OUTPUT_DIR = os.path.join(GRADIO_TEMP_DIR, "pic")
 os.makedirs(IMG_OUTPUT_DIR, exist_ok=True)
 
+# Formats browsers can display as is, saved without re-encoding
+WEB_IMAGE_TYPES = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+
+_image_executor = ThreadPoolExecutor(max_workers=int(os.getenv("IMAGE_SAVE_WORKERS", 4)))
+_image_lock = threading.Lock()
+# image_path -> pending save future, shared by parses so that an image is saved once
+_image_saves = {}
+# Save futures of the images referenced by the current parse, see image_saves()
+_parse_image_saves = contextvars.ContextVar("parse_image_saves", default=None)
+
+
+def _save_image(image_blob, image_path, encode):
+    tmp_path = image_path + ".tmp"
+    if encode:
+        Img.open(io.BytesIO(image_blob)).save(tmp_path, format="PNG")
+    else:
+        with open(tmp_path, "wb") as f:
+            f.write(image_blob)
+    # Never expose a partially written image
+    os.replace(tmp_path, image_path)
+
+
+def _forget_image_save(image_path, future):
+    # A failed save is retried by the next parse referencing the image
+    with _image_lock:
+        if _image_saves.get(image_path) is future:
+            del _image_saves[image_path]
+
+
+def save_image(image_blob, sha1, content_type) -> str:
+    """Save an image once per content, encoding it in the background if needed
+    :param image_blob: raw image bytes
+    :param sha1: sha1 of the image bytes
+    :param content_type: mime type of the image
+    :return: path of the saved image."""
+    ext = WEB_IMAGE_TYPES.get(content_type)
+    image_path = os.path.join(IMG_OUTPUT_DIR, sha1 + (ext or ".png"))
+    submitted = False
+    with _image_lock:
+        future = _image_saves.get(image_path)
+        if future is None:
+            if os.path.exists(image_path):
+                return image_path
+            future = _image_executor.submit(_save_image, image_blob, image_path, ext is None)
+            _image_saves[image_path] = future
+            submitted = True
+    if submitted:
+        future.add_done_callback(functools.partial(_forget_image_save, image_path))
+    parse_saves = _parse_image_saves.get()
+    if parse_saves is not None:
+        parse_saves.append((image_path, future))
+    return image_path
+
+
+@contextmanager
+def image_saves():
+    """Track the images saved while parsing, they must be on disk once parsing is done
+    :raise: the error of a failed save, the parsed elements would reference a missing image."""
+    parse_saves = []
+    token = _parse_image_saves.set(parse_saves)
+    try:
+        yield
+        wait([future for _, future in parse_saves])
+    finally:
+        _parse_image_saves.reset(token)
+    for image_path, future in parse_saves:
+        if future.exception() is not None:
+            print(f"Failed to save image {image_path}: {future.exception()}")
+            raise future.exception()
+
 
 class DocxParagraphPicturePartitioner:
     @classmethod
@@ -23,9 +103,6 @@ class DocxParagraphPicturePartitioner:
             for img in imgs:
                 embed = img.xpath(".//a:blip/@r:embed")[0]
                 related_part = opts.document.part.related_parts[embed]
-                image_blob = related_part.blob
-                image = Img.open(io.BytesIO(image_blob))
-                image_path = os.path.join(IMG_OUTPUT_DIR, str(embed) + related_part.sha1 + ".png")
-                image.save(image_path)
+                image_path = save_image(related_part.blob, related_part.sha1, related_part.content_type)
                 element_metadata = ElementMetadata(image_path=image_path)
             yield Image(text="IMAGE", metadata=element_metadata)
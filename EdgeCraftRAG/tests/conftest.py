@@ -0,0 +1,27 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# The server imports its modules as the edgecraftrag package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_generator(monkeypatch):
+    # QnAGenerator with an inline prompt template instead of a file in /templates
+    generator = pytest.importorskip("edgecraftrag.components.generator")
+
+    def make(inference_type=generator.InferenceType.VLLM, template="{context}\n{input}", **kwargs):
+        prompt = generator.DocumentedContextRagPromptTemplate.from_template(template)
+        monkeypatch.setattr(generator.os.path, "exists", lambda path: True)
+        monkeypatch.setattr(generator.DocumentedContextRagPromptTemplate, "from_file", lambda path: prompt)
+        return generator.QnAGenerator(
+            lambda: SimpleNamespace(model_id="fake"), "default_prompt.txt", inference_type, **kwargs
+        )
+
+    return make
@@ -0,0 +1,26 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+
+schema = pytest.importorskip("llama_index.core.schema")
+
+
+def nodes(*texts):
+    return [schema.NodeWithScore(node=schema.TextNode(text=text), score=1.0) for text in texts]
+
+
+def test_default_context_concatenates_chunks(make_generator):
+    qna = make_generator()
+    retrieved = nodes(" first chunk\n\nwith a blank line ", "second chunk\t\n")
+    # Same context as the historical "+=" loop over cleaned, stripped chunks
+    expected = "".join(qna.clean_string(n.node.get_text().strip()) for n in retrieved)
+    assert qna.build_context(retrieved) == expected == "first chunk\nwith a blank linesecond chunk"
+
+
+def test_context_separator_and_budget(make_generator):
+    qna = make_generator(context_separator="\n---\n", max_context_tokens=4)
+    # Without a local tokenizer a chunk of 8 characters counts as 3 tokens
+    assert qna.build_context(nodes("12345678", "abcdefgh")) == "12345678"
+    qna.max_context_tokens = None
+    assert qna.build_context(nodes("12345678", "abcdefgh")) == "12345678\n---\nabcdefgh"
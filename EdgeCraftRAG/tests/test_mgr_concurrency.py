@@ -0,0 +1,67 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+
+import pytest
+
+base = pytest.importorskip("edgecraftrag.base")
+
+WRITERS = 4
+READERS = 8
+ROUNDS = 500
+
+
+class Component(base.BaseComponent):
+
+    def run(self, **kwargs):
+        pass
+
+
+def test_concurrent_add_remove_while_reading():
+    mgr = base.BaseMgr()
+    # Always present, readers must never miss them
+    stable = [Component(name=f"stable-{i}") for i in range(8)]
+    for comp in stable:
+        mgr.add(comp)
+    stop = threading.Event()
+    errors = []
+
+    def writer(w):
+        try:
+            for i in range(ROUNDS):
+                comps = [Component(name=f"shared-{i % 16}"), Component(name=f"writer-{w}-{i}")]
+                for comp in comps:
+                    mgr.add(comp)
+                for comp in comps:
+                    mgr.remove(comp.idx)
+        except Exception as e:
+            errors.append(e)
+
+    def reader():
+        try:
+            while not stop.is_set():
+                for comp in stable:
+                    assert mgr.get_by_name(comp.name) is comp
+                    assert mgr.get_by_name_or_id(comp.idx) is comp
+                    assert mgr.get(comp.idx) is comp
+                for comp in list(mgr.components.values()):
+                    found = mgr.get_by_name(comp.name)
+                    # A name maps to a component carrying that name, or to nothing once removed
+                    assert found is None or found.name == comp.name
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader) for _ in range(READERS)]
+    writers = [threading.Thread(target=writer, args=(w,)) for w in range(WRITERS)]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    assert not errors, errors[0]
+    assert set(mgr.components) == {comp.idx for comp in stable}
+    assert mgr._names == {comp.name: comp for comp in stable}
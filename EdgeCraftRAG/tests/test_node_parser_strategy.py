@@ -0,0 +1,70 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import re
+
+import pytest
+
+pytest.importorskip("unstructured_inference")
+node_parser = pytest.importorskip("edgecraftrag.components.node_parser")
+
+PARAGRAPHS = [
+    "Edge Craft RAG runs retrieval augmented generation on Intel client and edge platforms.",
+    "Documents are parsed into nodes, embedded and stored in a vector index before retrieval.",
+    "The auto strategy probes each PDF and parses born digital text without layout detection.",
+    "Scanned pages without a text layer are parsed with optical character recognition instead.",
+    "Retrieved nodes are reranked and passed to the language model together with the question.",
+]
+
+
+def write_pdf(path, pages):
+    # Minimal born-digital PDF, one Helvetica text line per paragraph
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        text = "".join(f"BT /F1 11 Tf 56 {760 - 40 * i} Td ({line}) Tj ET\n" for i, line in enumerate(lines))
+        objects.append(f"<< /Length {len(text)} >>\nstream\n{text}endstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objects)} 0 R"
+            " /Resources << /Font << /F1 3 0 R >> >> >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(data)
+
+
+@pytest.fixture
+def text_pdf(tmp_path):
+    path = tmp_path / "born_digital.pdf"
+    write_pdf(path, [PARAGRAPHS, PARAGRAPHS[::-1]])
+    return str(path)
+
+
+def parse(file_path, strategy):
+    parser = node_parser.UnstructedNodeParser(chunk_size=250, chunk_overlap=0, strategy=strategy)
+    document = node_parser.Document(text="", metadata={"file_path": file_path})
+    return parser.run(docs=[document])
+
+
+def words(nodes):
+    return set(re.findall(r"\w+", " ".join(node.get_content().lower() for node in nodes)))
+
+
+def test_auto_keeps_hi_res_content(text_pdf):
+    assert node_parser.UnstructedNodeParser(strategy="auto").select_strategy(text_pdf) == "fast"
+    hi_res = parse(text_pdf, "hi_res")
+    auto = parse(text_pdf, "auto")
+    assert {node.metadata["parse_strategy"] for node in auto} == {"fast"}
+    # Layout detection may merge or split a few elements, but no content may be dropped
+    assert abs(len(auto) - len(hi_res)) <= max(1, len(hi_res) // 10)
+    assert words(hi_res) <= words(auto)
+    assert words(auto) >= set(re.findall(r"\w+", " ".join(PARAGRAPHS).lower()))
@@ -0,0 +1,72 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("aiohttp")
+from aiohttp import web
+
+generator = pytest.importorskip("edgecraftrag.components.generator")
+from comps.cores.proto.api_protocol import ChatCompletionRequest
+
+
+async def start_fake_openai():
+    # OpenAI compatible completions endpoint counting the client connections
+    state = {"peers": set(), "bodies": []}
+
+    async def completions(request):
+        state["peers"].add(request.transport.get_extra_info("peername"))
+        state["bodies"].append(await request.json())
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for text in ["Hello", " world"]:
+            chunk = {
+                "id": "cmpl-0",
+                "object": "text_completion",
+                "created": 0,
+                "model": "fake",
+                "choices": [{"index": 0, "text": text, "finish_reason": None, "logprobs": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/completions", completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}", state
+
+
+def test_vllm_client_reuses_connections(monkeypatch, make_generator):
+    async def run():
+        runner, endpoint, state = await start_fake_openai()
+        monkeypatch.setenv("vLLM_ENDPOINT", endpoint)
+        qna = make_generator()
+        try:
+            for _ in range(3):
+                request = ChatCompletionRequest(messages="What is OPEA?", stream=True, top_k=7, repetition_penalty=1.2)
+                response = qna.run_vllm(request, [])
+                chunks = [chunk async for chunk in response.body_iterator]
+                deltas = [
+                    json.loads(chunk)["llm_res"] for chunk in chunks if chunk.startswith(generator.LLM_RES_PREFIX)
+                ]
+                assert "".join(deltas) == "Hello world"
+        finally:
+            await runner.cleanup()
+        return state
+
+    state = asyncio.run(run())
+    assert len(state["bodies"]) == 3
+    # The pooled client keeps its connection alive across requests
+    assert len(state["peers"]) == 1
+    for body in state["bodies"]:
+        assert body["top_k"] == 7
+        assert body["repetition_penalty"] == 1.2
@@ -1,11 +1,13 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
 import os
 import sys
+import time
 
+import httpx
 import platform_config as pconf
-import requests
 
 sys.path.append("..")
 from edgecraftrag import api_schema
@@ -14,11 +16,84 @@ PIPELINE_SERVICE_HOST_IP = os.getenv("PIPELINE_SERVICE_HOST_IP", "127.0.0.1")
 PIPELINE_SERVICE_PORT = int(os.getenv("PIPELINE_SERVICE_PORT", 16010))
 server_addr = f"http://{PIPELINE_SERVICE_HOST_IP}:{PIPELINE_SERVICE_PORT}"
 
+# Timeout of quick requests, pipeline creation, activation and file uploads
+# load models or parse documents and are not limited
+CLIENT_TIMEOUT = float(os.getenv("CLIENT_TIMEOUT", 30))
+# Lifetime of cached pipeline and file lists, shared by all browser sessions
+CLIENT_CACHE_TTL = float(os.getenv("CLIENT_CACHE_TTL", 3))
+
+_client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    # One pooled client for all sessions, created on first use so that it
+    # belongs to the event loop of the UI server
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=server_addr,
+            timeout=httpx.Timeout(CLIENT_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            trust_env=False,
+        )
+    return _client
+
+
+class TTLCache:
+    """Cache of slow-changing responses. Concurrent misses of a key share a
+    single request, so open browser tabs do not multiply backend load."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries = {}
+        self._inflight = {}
+
+    async def get(self, key, fetch):
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+        return await asyncio.shield(task)
+
+    def _on_done(self, key, task):
+        # A fetch forgotten by invalidate() may have read the state before the change
+        if self._inflight.get(key) is not task:
+            return
+        del self._inflight[key]
+        if not task.cancelled() and task.exception() is None:
+            self._entries[key] = (time.monotonic(), task.result())
+
+    def invalidate(self, key=None):
+        # Fetches in flight are forgotten too, the next get() fetches again
+        if key is None:
+            self._entries.clear()
+            self._inflight.clear()
+        else:
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+
+
+_cache = TTLCache(CLIENT_CACHE_TTL)
+# Benchmark changes with every request, only concurrent polls are merged
+_benchmark_cache = TTLCache(0)
+
+
+async def _get_json(path):
+    res = await get_client().get(path)
+    return res.json()
 
-def get_current_pipelines():
-    res = requests.get(f"{server_addr}/v1/settings/pipelines", proxies={"http": None})
+
+async def _get_pipelines():
+    return await _cache.get("pipelines", lambda: _get_json("/v1/settings/pipelines"))
+
+
+async def get_current_pipelines():
     pls = []
-    for pl in res.json():
+    for pl in await _get_pipelines():
         if pl["status"]["active"]:
             pls.append((pl["idx"], pl["name"] + " (active)"))
         else:
@@ -26,12 +101,11 @@ def get_current_pipelines():
     return pls
 
 
-def get_pipeline(name):
-    res = requests.get(f"{server_addr}/v1/settings/pipelines/{name}", proxies={"http": None})
-    return res.json()
+async def get_pipeline(name):
+    return await _get_json(f"/v1/settings/pipelines/{name}")
 
 
-def create_update_pipeline(
+async def create_update_pipeline(
     name,
     active,
     node_parser,
@@ -84,13 +158,15 @@ def create_update_pipeline(
         ),
     )
     print(req_dict)
-    res = requests.post(f"{server_addr}/v1/settings/pipelines", json=req_dict.dict(), proxies={"http": None})
+    res = await get_client().post("/v1/settings/pipelines", json=req_dict.dict(), timeout=None)
+    _cache.invalidate("pipelines")
     return res.text
 
 
-def activate_pipeline(name):
+async def activate_pipeline(name):
     active_dict = {"active": "True"}
-    res = requests.patch(f"{server_addr}/v1/settings/pipelines/{name}", json=active_dict, proxies={"http": None})
+    res = await get_client().patch(f"/v1/settings/pipelines/{name}", json=active_dict, timeout=None)
+    _cache.invalidate("pipelines")
     status = False
     restext = f"Activate pipeline {name} failed."
     if res.ok and res.text:
@@ -99,60 +175,50 @@ def activate_pipeline(name):
     return {"response": restext}, status
 
 
-def remove_pipeline(name):
-    res = requests.delete(f"{server_addr}/v1/settings/pipelines/{name}", proxies={"http": None})
+async def remove_pipeline(name):
+    res = await get_client().delete(f"/v1/settings/pipelines/{name}")
+    _cache.invalidate("pipelines")
     restext = f"Remove pipeline {name} failed."
     if res.ok and res.text:
         restext = res.text
     return {"response": restext}
 
 
-def create_vectordb(docs, spliter):
+async def create_vectordb(docs, spliter):
     req_dict = api_schema.FilesIn(local_paths=docs)
-    res = requests.post(f"{server_addr}/v1/data/files", json=req_dict.dict(), proxies={"http": None})
+    res = await get_client().post("/v1/data/files", json=req_dict.dict(), timeout=None)
+    _cache.invalidate("files")
     return res.text
 
 
-def get_files():
-    res = requests.get(f"{server_addr}/v1/data/files", proxies={"http": None})
+async def get_files():
     files = []
-    for file in res.json():
+    for file in await _cache.get("files", lambda: _get_json("/v1/data/files")):
         files.append((file["file_name"], file["file_id"]))
     if not files:
         files.append((None, None))
     return files
 
 
-def delete_file(file_name_or_id):
-    res = requests.delete(f"{server_addr}/v1/data/files/{file_name_or_id}", proxies={"http": None})
+async def delete_file(file_name_or_id):
+    res = await get_client().delete(f"/v1/data/files/{file_name_or_id}", timeout=None)
+    _cache.invalidate("files")
     return res.text
 
 
-def get_actived_pipeline():
+async def get_actived_pipeline():
     try:
-        res = requests.get(
-            f"{server_addr}/v1/settings/pipelines",
-            proxies={
-                "http": None,
-            },
-        )
-        for pl in res.json():
+        for pl in await _get_pipelines():
             if pl["status"]["active"]:
                 return pl["name"]
         return None
-    except requests.RequestException:
+    except httpx.HTTPError:
         return None
 
 
-def get_benchmark(name):
+async def get_benchmark(name):
     try:
-        res = requests.get(
-            f"{server_addr}/v1/settings/pipelines/{name}/benchmark",
-            proxies={
-                "http": None,
-            },
-        )
-        data = res.json()
+        data = await _benchmark_cache.get(name, lambda: _get_json(f"/v1/settings/pipelines/{name}/benchmark"))
 
         if data.get("Benchmark enabled", False):
             benchmark_data = data.get("last_benchmark_data", {})
@@ -167,5 +233,5 @@ def get_benchmark(name):
                 return None
         else:
             return None
-    except requests.RequestException:
+    except httpx.HTTPError:
         return None
@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import argparse
+import asyncio
 import base64
 import json
 import os
@@ -16,7 +17,6 @@ import cpuinfo
 import distro  # if running Python 3.8 or above
 import ecrag_client as cli
 import gradio as gr
-import httpx
 
 # Creation of the ModelLoader instance and loading models remain the same
 import platform_config as pconf
@@ -29,7 +29,6 @@ from platform_config import (
     get_available_weights,
     get_local_available_models,
 )
-from unstructured.staging.base import elements_from_base64_gzipped_json
 
 pipeline_df = []
 
@@ -69,8 +68,25 @@ def extract_urls(text):
     return urls
 
 
+# System status shared by all sessions, see get_system_status
+_static_status = None
+_status_cache = (0.0, "")
+
+
 def get_system_status():
-    cpu_usage = psutil.cpu_percent(interval=1)
+    # Refreshed at most once per second whatever the number of open sessions,
+    # CPU usage is measured since the previous refresh instead of blocking
+    global _static_status, _status_cache
+    refreshed = time.monotonic()
+    if refreshed - _status_cache[0] < 1:
+        return _status_cache[1]
+    if _static_status is None:
+        os_info = platform.uname()
+        kernel_version = os_info.release
+        processor = cpuinfo.get_cpu_info()["brand_raw"]
+        dist_name = distro.name(pretty=True)
+        _static_status = f"Kernel: {kernel_version} \t" f"Processor: {processor} \t" f"OS: {dist_name} \n"
+    cpu_usage = psutil.cpu_percent(interval=None)
     memory_info = psutil.virtual_memory()
     memory_usage = memory_info.percent
     memory_total_gb = memory_info.total / (1024**3)
@@ -79,10 +95,6 @@ def get_system_status():
     # uptime_hours, uptime_minutes = divmod(uptime_seconds // 60, 60)
     disk_usage = psutil.disk_usage("/").percent
     # net_io = psutil.net_io_counters()
-    os_info = platform.uname()
-    kernel_version = os_info.release
-    processor = cpuinfo.get_cpu_info()["brand_raw"]
-    dist_name = distro.name(pretty=True)
 
     now = datetime.now()
     current_time_str = now.strftime("%Y-%m-%d %H:%M")
@@ -95,18 +107,17 @@ def get_system_status():
         f"Disk Usage: {disk_usage}% \t"
         # f"Bytes Sent: {net_io.bytes_sent}\n"
         # f"Bytes Received: {net_io.bytes_recv}\n"
-        f"Kernel: {kernel_version} \t"
-        f"Processor: {processor} \t"
-        f"OS: {dist_name} \n"
+        f"{_static_status}"
     )
+    _status_cache = (refreshed, status)
     return status
 
 
-def get_benchmark():
-    time.sleep(0.5)
-    active_pipeline_nam = get_actived_pipeline()
+async def get_benchmark():
+    await asyncio.sleep(0.5)
+    active_pipeline_nam = await get_actived_pipeline()
     if active_pipeline_nam:
-        data = cli.get_benchmark(active_pipeline_nam)
+        data = await cli.get_benchmark(active_pipeline_nam)
         if data:
             return gr.update(
                 visible=True,
@@ -116,8 +127,8 @@ def get_benchmark():
             return gr.update(visible=False)
 
 
-def get_actived_pipeline():
-    return cli.get_actived_pipeline()
+async def get_actived_pipeline():
+    return await cli.get_actived_pipeline()
 
 
 def build_app(cfg, args):
@@ -181,45 +192,43 @@ def build_app(cfg, args):
         image_paths = []
         reference_docs = set()
         IMAGE_NUMBER = 2
-        async with httpx.AsyncClient() as client:
-            async with client.stream("POST", f"{server_addr}/v1/chatqna", json=new_req, timeout=None) as response:
-                image_count = 0
-                async for chunk in response.aiter_text():
-                    if chunk.strip():
-                        try:
-                            data = json.loads(chunk)
-                            if "llm_res" in data:
-                                partial_text = partial_text + data["llm_res"]
-                            elif "score" in data:
-                                # show referenced docs
-                                if "filename" in data:
-                                    reference_doc = (
-                                        data["filename"]
-                                        if "page_number" not in data
-                                        else data["filename"] + " --page" + str(data["page_number"])
-                                    )
-                                    reference_docs.add(reference_doc)
-                                # show hyperlinks in chunk
-                                if data["score"] > 0.5 and "link_urls" in data:
-                                    if isinstance(data["link_urls"], str):
-                                        try:
-                                            url_list = json.loads(data["link_urls"])
-                                            link_urls.extend(url_list)
-                                        except json.JSONDecodeError:
-                                            print("link_urls is not a valid JSON string.")
-                                # show images in chunk
-                                if image_count < IMAGE_NUMBER and "orig_elements" in data:
-                                    elements = elements_from_base64_gzipped_json(data["orig_elements"])
-                                    for element in elements:
-                                        if element.metadata.image_path:
-                                            image_paths.append(element.metadata.image_path)
-                                            image_count += 1
-                            elif "retrieved_text" in data:
-                                link_urls.extend(extract_urls(data["retrieved_text"]))
-                        except json.JSONDecodeError:
-                            print(f"Received non-JSON chunk: {chunk}")
-                    history[-1][1] = partial_text
-                    yield history
+        # Reuse the pooled connections of the shared client, an absolute url overrides its base_url
+        async with cli.get_client().stream("POST", f"{server_addr}/v1/chatqna", json=new_req, timeout=None) as response:
+            image_count = 0
+            async for chunk in response.aiter_text():
+                if chunk.strip():
+                    try:
+                        data = json.loads(chunk)
+                        if "llm_res" in data:
+                            partial_text = partial_text + data["llm_res"]
+                        elif "score" in data:
+                            # show referenced docs
+                            if "filename" in data:
+                                reference_doc = (
+                                    data["filename"]
+                                    if "page_number" not in data
+                                    else data["filename"] + " --page" + str(data["page_number"])
+                                )
+                                reference_docs.add(reference_doc)
+                            # show hyperlinks in chunk
+                            if data["score"] > 0.5 and "link_urls" in data:
+                                if isinstance(data["link_urls"], str):
+                                    try:
+                                        url_list = json.loads(data["link_urls"])
+                                        link_urls.extend(url_list)
+                                    except json.JSONDecodeError:
+                                        print("link_urls is not a valid JSON string.")
+                            # show images in chunk
+                            if image_count < IMAGE_NUMBER and "image_paths" in data:
+                                for image_path in data["image_paths"][: IMAGE_NUMBER - image_count]:
+                                    image_paths.append(image_path)
+                                    image_count += 1
+                        elif "retrieved_text" in data:
+                            link_urls.extend(extract_urls(data["retrieved_text"]))
+                    except json.JSONDecodeError:
+                        print(f"Received non-JSON chunk: {chunk}")
+                history[-1][1] = partial_text
+                yield history
         if image_paths:
             history[-1][1] += "\n参考图片:\n"
             for image_path in image_paths:
@@ -293,9 +302,9 @@ def build_app(cfg, args):
             elem_id="white_border",
         )
 
-        def get_pipeline_df():
+        async def get_pipeline_df():
             global pipeline_df
-            pipeline_df = cli.get_current_pipelines()
+            pipeline_df = await cli.get_current_pipelines()
             return pipeline_df
 
         # -------------------
@@ -504,13 +513,13 @@ def build_app(cfg, args):
             else:
                 return gr.Accordion(visible=False)
 
-        def show_pipeline_detail(evt: gr.SelectData):
+        async def show_pipeline_detail(evt: gr.SelectData):
             # get selected pipeline id
             # Dataframe: {'headers': '', 'data': [[x00, x01], [x10, x11]}
             # SelectData.index: [i, j]
             # always use pipeline id for indexing
             selected_id = pipeline_df[evt.index[0]][0]
-            pl = cli.get_pipeline(selected_id)
+            pl = await cli.get_pipeline(selected_id)
             return (
                 pl["name"],
                 pl["status"]["active"],
@@ -538,7 +547,7 @@ def build_app(cfg, args):
         def modify_update_pipeline_button():
             return "Update Pipeline"
 
-        def create_update_pipeline(
+        async def create_update_pipeline(
             name,
             active,
             node_parser,
@@ -558,7 +567,7 @@ def build_app(cfg, args):
             rerank_id,
             rerank_device,
         ):
-            res = cli.create_update_pipeline(
+            res = await cli.create_update_pipeline(
                 name,
                 active,
                 node_parser,
@@ -578,7 +587,7 @@ def build_app(cfg, args):
                 rerank_id,
                 rerank_device,
             )
-            return res, get_pipeline_df()
+            return res, await get_pipeline_df()
 
         # Events
         u_llm_infertype.change(update_visibility, inputs=u_llm_infertype, outputs=accordion)
@@ -693,12 +702,12 @@ def build_app(cfg, args):
         # --------------
         # Chatbot Layout
         # --------------
-        def get_files():
-            return cli.get_files()
+        async def get_files():
+            return await cli.get_files()
 
-        def create_vectordb(docs, spliter):
-            res = cli.create_vectordb(docs, spliter)
-            return gr.update(value=get_files()), res, None
+        async def create_vectordb(docs, spliter):
+            res = await cli.create_vectordb(docs, spliter)
+            return gr.update(value=await get_files()), res, None
 
         global u_files_selected_row
         u_files_selected_row = None
@@ -712,20 +721,20 @@ def build_app(cfg, args):
             file_name, file_id = u_files_selected_row
             return f"File Name: {file_name}\nFile ID: {file_id}"
 
-        def deselect_file():
+        async def deselect_file():
             global u_files_selected_row
             u_files_selected_row = None
-            return gr.update(value=get_files()), "Selection cleared"
+            return gr.update(value=await get_files()), "Selection cleared"
 
-        def delete_file():
+        async def delete_file():
             global u_files_selected_row
             if u_files_selected_row is None:
                 res = "Please select a file first."
             else:
                 file_name, file_id = u_files_selected_row
                 u_files_selected_row = None
-                res = cli.delete_file(file_id)
-            return gr.update(value=get_files()), res
+                res = await cli.delete_file(file_id)
+            return gr.update(value=await get_files()), res
 
         with gr.Tab("Chatbot"):
             with gr.Row():
@@ -3,6 +3,8 @@
 
 import asyncio
 import os
+import tempfile
+from contextlib import ExitStack
 from typing import List
 
 from comps import MegaServiceEndpoint, MicroService, ServiceOrchestrator, ServiceRoleType, ServiceType
@@ -17,45 +19,51 @@ from comps.cores.proto.api_protocol import (
 from comps.cores.proto.docarray import LLMParams
 from fastapi import File, Request, UploadFile
 from fastapi.responses import StreamingResponse
+from summary_cache import SummaryCache, cached_response
+from uploads import extract_upload, spool_upload
 
 MEGA_SERVICE_PORT = int(os.getenv("MEGA_SERVICE_PORT", 8888))
 LLM_SERVICE_HOST_IP = os.getenv("LLM_SERVICE_HOST_IP", "0.0.0.0")
 LLM_SERVICE_PORT = int(os.getenv("LLM_SERVICE_PORT", 9000))
 
+# Uploads of a request are limited to MAX_UPLOAD_SIZE_MB in total, text is
+# extracted from them concurrently by a pool of worker processes, see uploads
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", 120))
 
-def read_pdf(file):
-    from langchain.document_loaders import PyPDFLoader
 
-    loader = PyPDFLoader(file)
-    docs = loader.load_and_split()
-    return docs
+# Outputs of identical requests are cached on disk, up to SUMMARY_CACHE_SIZE_MB,
+# 0 disables the cache
+SUMMARY_CACHE_DIR = os.getenv("SUMMARY_CACHE_DIR", "/tmp/faqgen_cache")
+SUMMARY_CACHE_SIZE = int(float(os.getenv("SUMMARY_CACHE_SIZE_MB", 256)) * 1024 * 1024)
 
 
-def read_text_from_file(file, save_file_name):
-    import docx2txt
-    from langchain.text_splitter import CharacterTextSplitter
+async def read_uploads(files: List[UploadFile]) -> List[str]:
+    """Extract the text of uploaded files concurrently, in worker processes.
 
-    # read text file
-    if file.headers["content-type"] == "text/plain":
-        file.file.seek(0)
-        content = file.file.read().decode("utf-8")
-        # Split text
-        text_splitter = CharacterTextSplitter()
-        texts = text_splitter.split_text(content)
-        # Create multiple documents
-        file_content = texts
-    # read pdf file
-    elif file.headers["content-type"] == "application/pdf":
-        documents = read_pdf(save_file_name)
-        file_content = [doc.page_content for doc in documents]
-    # read docx file
-    elif (
-        file.headers["content-type"] == "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        or file.headers["content-type"] == "application/octet-stream"
-    ):
-        file_content = docx2txt.process(save_file_name)
+    Args:
+        files (List[UploadFile]): Uploaded files.
+
+    Returns:
+        List[str]: Text chunks of all files, in upload order.
+    """
+    with ExitStack() as stack:
+        # Spooled one after the other, the limit applies to all files
+        uploads = []
+        total_size = 0
+        for file in files:
+            upload = stack.enter_context(tempfile.NamedTemporaryFile())
+            total_size += await spool_upload(file, upload, used=total_size)
+            uploads.append(upload)
+        texts = await asyncio.gather(
+            *[extract_upload(file, upload.name, EXTRACT_TIMEOUT) for file, upload in zip(files, uploads)]
+        )
+    file_summaries = []
+    for docs in texts:
+        file_summaries.extend(docs)
+    return file_summaries
 
-    return file_content
+
+summary_cache = SummaryCache(SUMMARY_CACHE_DIR, SUMMARY_CACHE_SIZE)
 
 
 class FaqGenService:
@@ -82,19 +90,7 @@ class FaqGenService:
         chat_request = ChatCompletionRequest.parse_obj(data)
         file_summaries = []
         if files:
-            for file in files:
-                file_path = f"/tmp/{file.filename}"
-
-                import aiofiles
-
-                async with aiofiles.open(file_path, "wb") as f:
-                    await f.write(await file.read())
-                docs = read_text_from_file(file, file_path)
-                os.remove(file_path)
-                if isinstance(docs, list):
-                    file_summaries.extend(docs)
-                else:
-                    file_summaries.append(docs)
+            file_summaries = await read_uploads(files)
 
         if file_summaries:
             prompt = handle_message(chat_request.messages) + "\n".join(file_summaries)
@@ -112,6 +108,18 @@ class FaqGenService:
             stream=stream_opt,
             model=chat_request.model if chat_request.model else None,
         )
+        cache_key = None
+        if summary_cache.enabled:
+            cache_key = await asyncio.to_thread(
+                SummaryCache.make_key,
+                query=prompt,
+                model=parameters.model,
+                max_tokens=parameters.max_tokens,
+                stream=parameters.stream,
+            )
+            entry = await asyncio.to_thread(summary_cache.get, cache_key)
+            if entry is not None:
+                return cached_response(entry, "faqgen")
         result_dict, runtime_graph = await self.megaservice.schedule(
             initial_inputs={"query": prompt}, llm_parameters=parameters
         )
@@ -122,9 +130,11 @@ class FaqGenService:
                 and node == list(self.megaservice.services.keys())[-1]
                 and self.megaservice.services[node].service_type == ServiceType.LLM
             ):
-                return response
+                return summary_cache.cache_stream(response, cache_key) if cache_key else response
         last_node = runtime_graph.all_leaves()[-1]
         response = result_dict[last_node]["text"]
+        if cache_key:
+            await asyncio.to_thread(summary_cache.put, cache_key, {"text": response})
         choices = []
         usage = UsageInfo()
         choices.append(
@@ -136,6 +146,13 @@ class FaqGenService:
         )
         return ChatCompletionResponse(model="faqgen", choices=choices, usage=usage)
 
+    async def get_cache_stats(self):
+        return summary_cache.stats()
+
+    async def purge_cache(self):
+        removed = await asyncio.to_thread(summary_cache.purge)
+        return {"purged": removed}
+
     def start(self):
         self.service = MicroService(
             self.__class__.__name__,
@@ -147,6 +164,8 @@ class FaqGenService:
             output_datatype=ChatCompletionResponse,
         )
         self.service.add_route(self.endpoint, self.handle_request, methods=["POST"])
+        self.service.add_route(self.endpoint + "/cache", self.get_cache_stats, methods=["GET"])
+        self.service.add_route(self.endpoint + "/cache", self.purge_cache, methods=["DELETE"])
         self.service.start()
 
 
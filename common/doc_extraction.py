@@ -0,0 +1,147 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+"""Text extraction of uploaded documents.
+
+Text is yielded lazily, page by page for PDF files and by chunks of at most
+CHUNK_SIZE characters for text and DOCX files, so that consumers can start
+working before the whole document is parsed. Documents are read from bytes,
+a file-like object or a path.
+
+This module is shared by the DocSum and FaqGen images, which get it through
+the "common" build context.
+"""
+
+import io
+import os
+import zipfile
+from typing import Iterator, List, Union
+from xml.etree import ElementTree
+
+TEXT_CONTENT_TYPE = "text/plain"
+PDF_CONTENT_TYPE = "application/pdf"
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+CONTENT_TYPES = {
+    ".txt": TEXT_CONTENT_TYPE,
+    ".pdf": PDF_CONTENT_TYPE,
+    ".docx": DOCX_CONTENT_TYPE,
+}
+
+# Size of the chunks of text and DOCX files, as CharacterTextSplitter by default
+CHUNK_SIZE = 4000
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+Source = Union[bytes, str, io.IOBase]
+
+
+class UnsupportedFileType(ValueError):
+    """The document is of a type that can't be extracted."""
+
+
+def content_type_from_name(name: str) -> str:
+    return CONTENT_TYPES.get(os.path.splitext(name)[1].lower())
+
+
+def _open(source: Source):
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+
+def _chunks(parts: Iterator[str], separator: str) -> Iterator[str]:
+    # Pack consecutive parts into chunks of at most CHUNK_SIZE characters
+    current = []
+    current_len = 0
+    for part in parts:
+        if not part.strip():
+            continue
+        if current and current_len + len(part) > CHUNK_SIZE:
+            yield separator.join(current)
+            current = []
+            current_len = 0
+        current.append(part)
+        current_len += len(part) + len(separator)
+    if current:
+        yield separator.join(current)
+
+
+def iter_text_file(source: Source) -> Iterator[str]:
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        data = source if isinstance(source, bytes) else source.read()
+    yield from _chunks(data.decode("utf-8").split("\n\n"), "\n\n")
+
+
+def iter_pdf(source: Source) -> Iterator[str]:
+    from pypdf import PdfReader
+
+    # Pages are parsed one at a time, when requested
+    reader = PdfReader(_open(source))
+    for page in reader.pages:
+        text = page.extract_text()
+        if text.strip():
+            yield text
+
+
+def _iter_docx_paragraphs(source: Source) -> Iterator[str]:
+    # Stream the paragraphs of the document body without building the whole tree
+    try:
+        docx = zipfile.ZipFile(_open(source))
+    except zipfile.BadZipFile:
+        # Legacy binary .doc files are OLE containers, not zip archives
+        raise UnsupportedFileType("Not a DOCX document, legacy .doc files are not supported")
+    with docx:
+        if "word/document.xml" not in docx.namelist():
+            raise UnsupportedFileType("Not a DOCX document")
+        with docx.open("word/document.xml") as document:
+            parts = []
+            for _, elem in ElementTree.iterparse(document):
+                if elem.tag == _W + "t" and elem.text:
+                    parts.append(elem.text)
+                elif elem.tag == _W + "tab":
+                    parts.append("\t")
+                elif elem.tag in (_W + "br", _W + "cr"):
+                    parts.append("\n")
+                elif elem.tag == _W + "p":
+                    yield "".join(parts)
+                    parts = []
+                    elem.clear()
+
+
+def iter_docx(source: Source) -> Iterator[str]:
+    yield from _chunks(_iter_docx_paragraphs(source), "\n")
+
+
+def iter_text(source: Source, content_type: str) -> Iterator[str]:
+    """Yield the text of a document lazily.
+
+    Args:
+        source (Union[bytes, str, io.IOBase]): Content, path or file-like object of the document.
+        content_type (str): Content type of the document.
+
+    Returns:
+        Iterator[str]: Pages or chunks of the text of the document.
+    """
+    if content_type == TEXT_CONTENT_TYPE:
+        return iter_text_file(source)
+    elif content_type == PDF_CONTENT_TYPE:
+        return iter_pdf(source)
+    elif content_type in (DOCX_CONTENT_TYPE, "application/octet-stream"):
+        return iter_docx(source)
+    raise UnsupportedFileType(f"Unsupported file type: {content_type}")
+
+
+def read_text(content_type: str, source: Source) -> List[str]:
+    """Extract all the text of a document, e.g. in a worker process.
+
+    Args:
+        content_type (str): Content type of the document.
+        source (Union[bytes, str, io.IOBase]): Content or path of the document, a path
+            keeps large documents from being pickled to the worker.
+
+    Returns:
+        List[str]: Pages or chunks of the text of the document.
+    """
+    return list(iter_text(source, content_type))
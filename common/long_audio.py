@@ -0,0 +1,146 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+"""Transcription of long audio by segments, shared by DocSum and AudioQnA.
+
+Long audio is split at silences into segments of at most ASR_SEGMENT_SECONDS
+which are transcribed concurrently, at most ASR_CONCURRENCY at a time, and
+stitched in order. Decoding and framing run in worker threads so that the
+event loop is not stalled by large payloads.
+"""
+
+import asyncio
+import base64
+import binascii
+import io
+import os
+import shutil
+import wave
+from typing import List
+
+import aiohttp
+import numpy as np
+
+ASR_SEGMENT_SECONDS = float(os.getenv("ASR_SEGMENT_SECONDS", 30))
+ASR_CONCURRENCY = int(os.getenv("ASR_CONCURRENCY", 4))
+# Shorter base64 audio is sent to the ASR service as is
+ASR_SPLIT_MIN_SIZE = 256 * 1024
+SILENCE_SEARCH_SECONDS = 5
+
+# ffmpeg runs at most FFMPEG_CONCURRENCY processes at a time
+FFMPEG_CONCURRENCY = int(os.getenv("FFMPEG_CONCURRENCY", 2))
+ffmpeg_semaphore = asyncio.Semaphore(FFMPEG_CONCURRENCY)
+
+
+def split_at_silences(samples: np.ndarray, sample_rate: int) -> List[np.ndarray]:
+    """Split audio into segments of at most ASR_SEGMENT_SECONDS, cut at the
+    quietest point of the last seconds of each segment.
+
+    Args:
+        samples (np.ndarray): Mono int16 samples.
+        sample_rate (int): Sample rate of the audio.
+
+    Returns:
+        List[np.ndarray]: Consecutive segments of the audio.
+    """
+    segment = int(ASR_SEGMENT_SECONDS * sample_rate)
+    search = int(min(SILENCE_SEARCH_SECONDS, ASR_SEGMENT_SECONDS / 2) * sample_rate)
+    frame = max(1, sample_rate // 100)
+    segments = []
+    start = 0
+    while len(samples) - start > segment:
+        window_start = start + segment - search
+        frames = samples[window_start : window_start + search // frame * frame].astype(np.float32)
+        energy = np.square(frames.reshape(-1, frame)).mean(axis=1)
+        cut = window_start + int(np.argmin(energy)) * frame + frame // 2
+        segments.append(samples[start:cut])
+        start = cut
+    segments.append(samples[start:])
+    return segments
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int) -> str:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.tobytes())
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def read_wav(audio: bytes):
+    # Mono int16 samples and sample rate of a 16-bit WAV file, None otherwise
+    try:
+        with wave.open(io.BytesIO(audio)) as wav_file:
+            if wav_file.getsampwidth() != 2:
+                return None
+            samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+            channels = wav_file.getnchannels()
+            if channels > 1:
+                samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+            return samples, wav_file.getframerate()
+    except (wave.Error, EOFError, ValueError):
+        return None
+
+
+async def decode_audio(audio_base64: str):
+    # Mono int16 samples and sample rate of the audio, None if it can't be decoded
+    try:
+        audio = await asyncio.to_thread(base64.b64decode, audio_base64)
+    except (binascii.Error, ValueError):
+        return None
+    if audio.startswith(b"RIFF"):
+        decoded = await asyncio.to_thread(read_wav, audio)
+        if decoded is not None:
+            return decoded
+    if shutil.which("ffmpeg") is None:
+        return None
+    async with ffmpeg_semaphore:
+        proc = await asyncio.create_subprocess_exec(
+            "ffmpeg",
+            "-i",
+            "pipe:0",
+            *["-f", "s16le", "-ac", "1", "-ar", "16000", "pipe:1"],
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        pcm, _ = await proc.communicate(audio)
+    if proc.returncode != 0:
+        return None
+    return np.frombuffer(pcm, dtype=np.int16), 16000
+
+
+async def transcribe_long_audio(audio_base64: str, asr_url: str):
+    """Transcribe long audio by segments, concurrently and in order.
+
+    Args:
+        audio_base64 (str): Base64 encoded audio.
+        asr_url (str): URL of the /v1/asr endpoint of the ASR service.
+
+    Returns:
+        Optional[str]: The transcript, None if the audio is short enough for a single ASR request
+            or can't be decoded, in which case it is sent to the ASR service as is.
+    """
+    if len(audio_base64) < ASR_SPLIT_MIN_SIZE:
+        return None
+    decoded = await decode_audio(audio_base64)
+    if decoded is None:
+        return None
+    samples, sample_rate = decoded
+    segments = await asyncio.to_thread(split_at_silences, samples, sample_rate)
+    if len(segments) <= 1:
+        return None
+    semaphore = asyncio.Semaphore(ASR_CONCURRENCY)
+
+    async def transcribe(session, segment):
+        async with semaphore:
+            audio = await asyncio.to_thread(encode_wav, segment, sample_rate)
+            async with session.post(asr_url, json={"audio": audio}) as response:
+                response.raise_for_status()
+                return (await response.json())["asr_result"].strip()
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None)) as session:
+        texts = await asyncio.gather(*[transcribe(session, segment) for segment in segments])
+    return " ".join(text for text in texts if text)
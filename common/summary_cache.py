@@ -0,0 +1,158 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+"""Disk cache of the outputs of the DocSum, FaqGen and AudioQnA megaservices."""
+
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from comps.cores.proto.api_protocol import ChatCompletionResponse, ChatCompletionResponseChoice, ChatMessage, UsageInfo
+from fastapi.responses import StreamingResponse
+
+
+class SummaryCache:
+    """Disk cache of the final outputs of requests, keyed by a hash of the
+    request content and parameters. Entries are stored as JSON, gzip
+    compressed if compress is set, and may record the seconds their output
+    took to produce, which are counted as saved on hits. Least recently used
+    entries are evicted once the cache exceeds max_size bytes."""
+
+    def __init__(self, cache_dir: str, max_size: int, compress: bool = False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.compress = compress
+        self.suffix = ".json.gz" if compress else ".json"
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self._lock = threading.Lock()
+        # key -> size of the entry, least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+        if self.enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+            paths = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(self.suffix)]
+            for path in sorted(paths, key=os.path.getmtime):
+                self._entries[os.path.basename(path)[: -len(self.suffix)]] = os.path.getsize(path)
+            self._size = sum(self._entries.values())
+            self._evict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def make_key(**fields) -> str:
+        return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def get(self, key: str):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            entry = json.loads(gzip.decompress(data) if self.compress else data)
+            os.utime(self._path(key))
+        except (OSError, EOFError, ValueError):
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+            return None
+        with self._lock:
+            self.seconds_saved += entry.get("seconds", 0.0)
+        return entry
+
+    def put(self, key: str, entry: dict):
+        data = json.dumps(entry).encode("utf-8")
+        if self.compress:
+            data = gzip.compress(data, compresslevel=6)
+        if len(data) > self.max_size:
+            return
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._size += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_size and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def purge(self) -> int:
+        with self._lock:
+            removed = len(self._entries)
+            for key in self._entries:
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._entries.clear()
+            self._size = 0
+        return removed
+
+    def cache_stream(self, response: StreamingResponse, key: str) -> StreamingResponse:
+        # Cache the streamed output once it has been fully sent
+        body_iterator = response.body_iterator
+
+        async def tee():
+            chunks = []
+            async for chunk in body_iterator:
+                chunks.append(base64.b64encode(chunk if isinstance(chunk, bytes) else chunk.encode("utf-8")).decode())
+                yield chunk
+            await asyncio.to_thread(self.put, key, {"chunks": chunks})
+
+        response.body_iterator = tee()
+        return response
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "seconds_saved": round(self.seconds_saved, 3),
+                "entries": len(self._entries),
+                "size": self._size,
+                "max_size": self.max_size,
+            }
+
+
+def cached_response(entry: dict, model: str):
+    # Replay a cached output, as a stream if it was streamed
+    if "chunks" in entry:
+
+        async def replay():
+            for chunk in entry["chunks"]:
+                yield base64.b64decode(chunk)
+
+        return StreamingResponse(replay(), media_type="text/event-stream")
+    choices = [
+        ChatCompletionResponseChoice(
+            index=0,
+            message=ChatMessage(role="assistant", content=entry["text"]),
+            finish_reason="stop",
+        )
+    ]
+    return ChatCompletionResponse(model=model, choices=choices, usage=UsageInfo())
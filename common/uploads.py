@@ -0,0 +1,79 @@
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+"""Bounded reading of uploaded documents and extraction of their text.
+
+Uploads are read by chunks, up to MAX_UPLOAD_SIZE_MB, into temporary files
+whose paths are given to a pool of EXTRACT_WORKERS worker processes, so that
+documents are neither held whole in memory nor pickled to the workers.
+
+This module is shared by the DocSum and FaqGen images, which get it through
+the "common" build context, next to doc_extraction.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, List
+
+from doc_extraction import UnsupportedFileType, read_text
+from fastapi import HTTPException, UploadFile
+
+MAX_UPLOAD_SIZE = int(float(os.getenv("MAX_UPLOAD_SIZE_MB", 100)) * 1024 * 1024)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", 4))
+UPLOAD_READ_CHUNK = 1024 * 1024
+
+_extract_pool = None
+
+
+def get_extract_pool() -> ProcessPoolExecutor:
+    global _extract_pool
+    if _extract_pool is None:
+        _extract_pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+    return _extract_pool
+
+
+async def spool_upload(file: UploadFile, dest: IO[bytes], used: int = 0) -> int:
+    """Copy an upload to a file by chunks, stopping at MAX_UPLOAD_SIZE.
+
+    Args:
+        file (UploadFile): Uploaded file.
+        dest (IO[bytes]): File to copy the upload to, e.g. a temporary file.
+        used (int): Bytes already uploaded by the request, when the limit applies to all its files.
+
+    Returns:
+        int: Size of the upload.
+    """
+    detail = f"Uploaded files exceed {MAX_UPLOAD_SIZE} bytes at {file.filename}"
+    # Reject oversized uploads before reading them, the size is unknown for some clients
+    if file.size is not None and used + file.size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail=detail)
+    size = 0
+    while chunk := await file.read(UPLOAD_READ_CHUNK):
+        size += len(chunk)
+        if used + size > MAX_UPLOAD_SIZE:
+            raise HTTPException(status_code=413, detail=detail)
+        await asyncio.to_thread(dest.write, chunk)
+    await asyncio.to_thread(dest.flush)
+    return size
+
+
+async def extract_upload(file: UploadFile, path: str, timeout: float = None) -> List[str]:
+    """Extract the text of a spooled upload in a worker process.
+
+    Args:
+        file (UploadFile): Uploaded file, for its content type and name.
+        path (str): Path of the file the upload was spooled to.
+        timeout (float): Seconds after which extraction is abandoned, no limit by default.
+
+    Returns:
+        List[str]: Pages or chunks of the text of the document.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(get_extract_pool(), read_text, file.headers["content-type"], path)
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=422, detail=f"Text extraction of {file.filename} timed out")
+    except UnsupportedFileType as e:
+        raise HTTPException(status_code=415, detail=f"{file.filename}: {e}")